@@ -0,0 +1,45 @@
+import os
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db.models import Count
+
+from posts.models import Group, Post, UserStats
+
+BENCH_USERS = int(os.environ.get('BENCH_USERS', 200))
+BENCH_POSTS = int(os.environ.get('BENCH_POSTS', 5000))
+
+
+@pytest.fixture(scope='session')
+def dataset(django_db_setup, django_db_blocker):
+    """Набор данных seed_yatube, общий для всех замеров.
+
+    Возвращает самого активного автора и подписчика, группу и пост
+    с наибольшим числом комментариев.
+    """
+
+    with django_db_blocker.unblock():
+        call_command(
+            'seed_yatube',
+            users=BENCH_USERS,
+            posts=BENCH_POSTS,
+            comments=BENCH_POSTS // 2,
+            stdout=StringIO(),
+        )
+        stats = UserStats.objects.select_related('user')
+        return {
+            'author': stats.order_by('-posts_count').first().user,
+            'follower': stats.order_by('-following_count').first().user,
+            'group': Group.objects.order_by('id').first(),
+            'post': Post.objects.annotate(
+                comments_total=Count('comments')
+            ).order_by('-comments_total').first(),
+        }
+
+
+@pytest.fixture(autouse=True)
+def production_settings(settings):
+    """Журнал запросов выключен, как в production, и в замеры не входит."""
+
+    settings.QUERY_LOG = False
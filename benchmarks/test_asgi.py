@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import pytest
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client
+
+from core.asgi import ASGIHandler, environ
+
+from .test_views import TOLERANCE, VIEWS
+
+REQUESTS = int(os.environ.get('BENCH_ASGI_REQUESTS', 100))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 8))
+REPEATS = 3
+
+
+def make_scope(path, cookie):
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 50000),
+    }
+
+
+def call_wsgi(handler, scope):
+    statuses = []
+    result = handler(
+        environ(scope, BytesIO()),
+        lambda status, headers, exc_info=None: statuses.append(status)
+    )
+    b''.join(result)
+    result.close()
+    return int(statuses[0].split(' ', 1)[0])
+
+
+async def call_asgi(app, scope, semaphore):
+    statuses = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    async with semaphore:
+        await app(scope, receive, send)
+    return statuses[0]
+
+
+def run_wsgi(handler, scope):
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        return list(executor.map(
+            lambda _: call_wsgi(handler, scope), range(REQUESTS)
+        ))
+
+
+async def run_asgi(app, scope):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    return await asyncio.gather(*(
+        call_asgi(app, scope, semaphore) for _ in range(REQUESTS)
+    ))
+
+
+def timed_ms(func, *args):
+    """Лучшее из REPEATS время серии запросов, как в timeit."""
+
+    timings = []
+    for _ in range(REPEATS):
+        cache.clear()
+        start = time.perf_counter()
+        statuses = func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert set(statuses) == {200}
+    return min(timings)
+
+
+@pytest.mark.parametrize('name', VIEWS)
+def test_asgi_against_wsgi(name, dataset, django_db_blocker):
+    """REQUESTS запросов по CONCURRENCY одновременно: ASGI не медленнее.
+
+    Данные набора зафиксированы в базе, поэтому потоки пулов со своими
+    соединениями их видят; тест выполняется вне транзакции.
+    """
+
+    with django_db_blocker.unblock():
+        client = Client()
+        client.force_login(dataset['follower'])
+        cookie = client.cookies.output(attrs=[], header='', sep=';')
+        scope = make_scope(VIEWS[name](dataset), cookie.strip())
+        wsgi_handler, asgi_app = WSGIHandler(), ASGIHandler()
+        call_wsgi(wsgi_handler, scope)
+        asyncio.run(run_asgi(asgi_app, scope))
+
+        wsgi_ms = timed_ms(run_wsgi, wsgi_handler, scope)
+        asgi_ms = timed_ms(
+            lambda: asyncio.run(run_asgi(asgi_app, scope))
+        )
+    print(f'\n{name}: WSGI {wsgi_ms:.0f} мс, ASGI {asgi_ms:.0f} мс')
+    assert asgi_ms <= wsgi_ms * (1 + TOLERANCE), (
+        f'{name}: ASGI {asgi_ms:.0f} мс, WSGI {wsgi_ms:.0f} мс'
+    )
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import OperationalError, connection, connections, transaction
+
+from .test_views import TOLERANCE
+
+WRITERS = int(os.environ.get('BENCH_WRITERS', 8))
+WRITES = int(os.environ.get('BENCH_WRITES', 50))
+ENGINES = {
+    'stock': 'django.db.backends.sqlite3',
+    'tuned': 'core.db.sqlite3',
+}
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, comments INTEGER NOT NULL)',
+    'CREATE TABLE comment '
+    '(id INTEGER PRIMARY KEY, post_id INTEGER, text TEXT)',
+    'INSERT INTO post (id, comments) VALUES (1, 0)',
+)
+
+
+@contextmanager
+def temporary_database(name, engine):
+    """Псевдоним базы в отдельном файле на время замера."""
+
+    alias = f'bench_{name}'
+    with tempfile.TemporaryDirectory() as directory:
+        connections.databases[alias] = {
+            **connection.settings_dict,
+            'ENGINE': engine,
+            'NAME': os.path.join(directory, 'db.sqlite3'),
+        }
+        try:
+            with connections[alias].cursor() as cursor:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+            yield alias
+        finally:
+            connections[alias].close()
+            del connections.databases[alias]
+
+
+def add_comments(alias):
+    """Транзакции как у add_comment: чтение, вставка, счётчик."""
+
+    errors = 0
+    try:
+        for number in range(WRITES):
+            try:
+                with transaction.atomic(using=alias):
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute(
+                            'SELECT comments FROM post WHERE id = 1'
+                        )
+                        cursor.execute(
+                            'INSERT INTO comment (post_id, text) '
+                            'VALUES (1, %s)',
+                            [f'Комментарий {number}'],
+                        )
+                        cursor.execute(
+                            'UPDATE post SET comments = comments + 1 '
+                            'WHERE id = 1'
+                        )
+            except OperationalError:
+                errors += 1
+    finally:
+        connections[alias].close()
+    return errors
+
+
+def measure(alias):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(WRITERS) as executor:
+        errors = sum(executor.map(add_comments, [alias] * WRITERS))
+    elapsed = time.perf_counter() - start
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT comments FROM post WHERE id = 1')
+        written = cursor.fetchone()[0]
+    assert written == WRITERS * WRITES - errors
+    return {'writes_per_s': round(written / elapsed), 'errors': errors}
+
+
+def test_sqlite_writers(django_db_blocker):
+    """WRITERS потоков пишут одновременно: без ошибок и не медленнее."""
+
+    results = {}
+    with django_db_blocker.unblock():
+        for name, engine in ENGINES.items():
+            with temporary_database(name, engine) as alias:
+                results[name] = measure(alias)
+    print(f'\n{WRITERS} потоков по {WRITES} записей: {results}')
+
+    stock, tuned = results['stock'], results['tuned']
+    assert tuned['errors'] == 0
+    assert tuned['writes_per_s'] >= stock['writes_per_s'] * (1 - TOLERANCE)
@@ -0,0 +1,196 @@
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .conftest import BENCH_POSTS, BENCH_USERS
+
+BASELINES_PATH = Path(__file__).with_name('baselines.json')
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 50))
+TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', 0.5))
+# Время ответа сравнивается после поправки на скорость машины
+# по калибровке, и всё равно шумнее памяти; хвост шумнее медианы.
+LATENCY_TOLERANCES = {
+    'p50_ms': TOLERANCE,
+    'p99_ms': float(os.environ.get('BENCH_P99_TOLERANCE', 1.0)),
+}
+PEAK_TOLERANCE = float(os.environ.get('BENCH_PEAK_TOLERANCE', 0.1))
+UPDATE = bool(os.environ.get('BENCH_UPDATE'))
+
+# Калибровка: рендер шаблона и запросы к базе, как у страниц, но
+# без зависимости от кода проекта. Её время показывает, насколько
+# машина быстрее или медленнее той, где сохранены замеры.
+CALIBRATION_ROUNDS = 20
+CALIBRATION_TEMPLATE = (
+    '{% for item in items %}<p>{{ item.text|truncatewords:5 }} '
+    '{{ item.number|floatformat:2 }}</p>{% endfor %}'
+)
+CALIBRATION_ITEMS = [
+    {'text': f'Калибровочный текст номер {number}', 'number': number}
+    for number in range(500)
+]
+
+VIEWS = {
+    'index': lambda data: reverse('posts:index'),
+    'group_posts': lambda data: reverse(
+        'posts:group_list', args=[data['group'].slug]
+    ),
+    'profile': lambda data: reverse(
+        'posts:profile', args=[data['author'].username]
+    ),
+    'post_detail': lambda data: reverse(
+        'posts:post_detail', args=[data['post'].id]
+    ),
+    'follow_index': lambda data: reverse('posts:follow_index'),
+}
+
+
+def load_baselines():
+    if not BASELINES_PATH.exists():
+        return {}
+    return json.loads(BASELINES_PATH.read_text())
+
+
+def save_baseline(name, result, calibration_ms):
+    baselines = load_baselines()
+    if baselines.get('dataset') != dataset_size():
+        baselines = {'dataset': dataset_size(), 'views': {}}
+    baselines['calibration_ms'] = calibration_ms
+    baselines['views'][name] = result
+    BASELINES_PATH.write_text(
+        json.dumps(baselines, indent=2, sort_keys=True) + '\n'
+    )
+
+
+def dataset_size():
+    return {'users': BENCH_USERS, 'posts': BENCH_POSTS}
+
+
+def calibrate():
+    """Медиана времени калибровочной нагрузки в миллисекундах.
+
+    Шаблон компилируется здесь, а не при импорте: движок шаблонов
+    создаётся один раз и запоминает DEBUG, который pytest-django
+    выключает только перед тестами.
+    """
+
+    template = Template(CALIBRATION_TEMPLATE)
+    gc.collect()
+    gc.disable()
+    timings = []
+    try:
+        for _ in range(CALIBRATION_ROUNDS):
+            start = time.perf_counter()
+            template.render(Context({'items': CALIBRATION_ITEMS}))
+            with connection.cursor() as cursor:
+                for number in range(50):
+                    cursor.execute('SELECT %s', [number])
+                    cursor.fetchone()
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        gc.enable()
+    return round(statistics.median(timings), 2)
+
+
+def measure(client, url):
+    """Число запросов, p50/p99 времени ответа и пик памяти без кеша."""
+
+    # Первый запрос компилирует шаблоны и не входит в замеры; сборщик
+    # мусора на время замеров отключается, как в timeit.
+    client.get(url)
+    gc.collect()
+    gc.disable()
+    timings = []
+    try:
+        for _ in range(ROUNDS):
+            cache.clear()
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+    finally:
+        gc.enable()
+
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url)
+    query_count = len(queries)
+
+    # tracemalloc не считает суммарно выделенную память, только
+    # занятую сейчас и её пик: сохраняется пик за время запроса.
+    cache.clear()
+    tracemalloc.start()
+    client.get(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(timings, n=100)
+    return {
+        'queries': query_count,
+        'p50_ms': round(statistics.median(timings), 2),
+        'p99_ms': round(percentiles[98], 2),
+        'peak_kb': round(peak / 1024),
+    }
+
+
+@pytest.fixture(scope='module')
+def calibration_ms(dataset, django_db_blocker):
+    with django_db_blocker.unblock():
+        return calibrate()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', VIEWS)
+def test_view_benchmark(name, dataset, calibration_ms, client):
+    """Замеры представления не хуже сохранённых.
+
+    Число запросов сравнивается точно, пик памяти — с допуском
+    PEAK_TOLERANCE. Время ответа сравнивается с сохранённым, умноженным
+    на отношение калибровок этой машины и той, где оно сохранено.
+    """
+
+    client.force_login(dataset['follower'])
+    result = measure(client, VIEWS[name](dataset))
+    print(f'\n{name}: {result}, калибровка {calibration_ms} мс')
+
+    if UPDATE:
+        save_baseline(name, result, calibration_ms)
+        return
+
+    baselines = load_baselines()
+    if (
+        baselines.get('dataset') != dataset_size()
+        or 'calibration_ms' not in baselines
+    ):
+        pytest.skip('Нет замеров для этого набора данных, BENCH_UPDATE=1')
+    baseline = baselines['views'].get(name)
+    if baseline is None:
+        pytest.skip(f'Нет замеров для {name}, запустите с BENCH_UPDATE=1')
+
+    assert result['queries'] <= baseline['queries'], (
+        f'{name}: запросов {result["queries"]}, было {baseline["queries"]}'
+    )
+    limit = baseline['peak_kb'] * (1 + PEAK_TOLERANCE)
+    assert result['peak_kb'] <= limit, (
+        f'{name}: peak_kb = {result["peak_kb"]}, '
+        f'допустимо до {limit:.0f} (было {baseline["peak_kb"]})'
+    )
+
+    speed = calibration_ms / baselines['calibration_ms']
+    for metric, tolerance in LATENCY_TOLERANCES.items():
+        limit = baseline[metric] * speed * (1 + tolerance)
+        assert result[metric] <= limit, (
+            f'{name}: {metric} = {result[metric]}, допустимо до '
+            f'{limit:.2f} (было {baseline[metric]} при калибровке '
+            f'{baselines["calibration_ms"]}, сейчас {calibration_ms})'
+        )
@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,15 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Загруженные в тестах файлы пишутся во временный каталог.
+
+    Пул миниатюр выключен: его потоки дописывали бы файлы уже после
+    того, как MEDIA_ROOT вернётся к каталогу проекта.
+    """
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.THUMBNAIL_WORKERS = 0
@@ -0,0 +1,153 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+
+RESPONSE_QUEUE_SIZE = 8
+
+
+class ASGIHandler:
+    """ASGI-приложение поверх обработчика WSGI.
+
+    В Django 2.2 нет асинхронных представлений, поэтому каждый запрос
+    целиком выполняется в пуле из ASGI_THREADS потоков: цикл событий
+    принимает соединения и передаёт ответы, а медленные запросы к базе
+    занимают только поток пула. Тело ответа передаётся частями через
+    очередь, потоковые ответы не собираются в памяти.
+    """
+
+    def __init__(self):
+        self.wsgi = WSGIHandler()
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS,
+            thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемое соединение {scope["type"]}')
+
+        body = await self.read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(RESPONSE_QUEUE_SIZE)
+        future = loop.run_in_executor(
+            self.executor, self.serve, scope, body, loop, queue
+        )
+        try:
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                await send(message)
+        except BaseException:
+            # Поток пула не должен остаться ждать места в очереди, если
+            # клиент отключился.
+            asyncio.ensure_future(self.drain(queue))
+            raise
+        await future
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def read_body(receive):
+        """Тело запроса; большое тело хранится во временном файле."""
+
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    @staticmethod
+    async def drain(queue):
+        while await queue.get() is not None:
+            pass
+
+    def serve(self, scope, body, loop, queue):
+        """Выполняет запрос в потоке пула и отдаёт сообщения ответа."""
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            put({
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [
+                    (name.lower().encode('latin1'), value.encode('latin1'))
+                    for name, value in headers
+                ],
+            })
+
+        try:
+            with body:
+                result = self.wsgi(environ(scope, body), start_response)
+                try:
+                    for chunk in result:
+                        if chunk:
+                            put({
+                                'type': 'http.response.body',
+                                'body': chunk,
+                                'more_body': True,
+                            })
+                finally:
+                    result.close()
+            put({'type': 'http.response.body', 'body': b''})
+        finally:
+            put(None)
+
+
+def environ(scope, body):
+    """Окружение WSGI для запроса ASGI."""
+
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    result = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        if name in result:
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = f'{result[name]}{separator}{value}'
+        result[name] = value
+    return result
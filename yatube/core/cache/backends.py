@@ -0,0 +1,117 @@
+import os
+import pickle
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+
+from .metrics import cache_metrics
+
+MISSING = object()
+# Ключи делят блокировки по первым символам имени файла: файлов
+# блокировок не больше 256, а ключи с разными блокировками не ждут друг
+# друга.
+LOCK_PREFIX_LENGTH = 2
+LOCK_SUFFIX = '.lock'
+# По умолчанию число записей сверяется с MAX_ENTRIES не чаще раза
+# в минуту в каждом процессе.
+CULL_INTERVAL = 60
+
+
+class MeteredCacheMixin:
+    """Учитывает попадания и промахи get() в cache_metrics."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        cache_metrics.record(key, value is not MISSING)
+        return default if value is MISSING else value
+
+
+class MeteredLocMemCache(MeteredCacheMixin, LocMemCache):
+    """Кеш в памяти процесса. Подходит для разработки и тестов."""
+
+
+class MeteredFileBasedCache(MeteredCacheMixin, FileBasedCache):
+    """Кеш в файлах, общий для всех воркеров на одном сервере.
+
+    add() и incr() читают и пишут файл под блокировкой, поэтому
+    атомарны и между процессами: на них держатся блокировка рендера
+    страницы и версии кеша страниц. Каталог перебирается для
+    вытеснения не при каждом set(), а раз в OPTIONS['CULL_INTERVAL']
+    секунд, поэтому записей может ненадолго стать больше MAX_ENTRIES.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get(
+            'CULL_INTERVAL', CULL_INTERVAL
+        )
+        self._culled_at = None
+
+    @contextmanager
+    def _locked(self, fname):
+        """Блокирует файл ключа между процессами и потоками."""
+
+        self._createdir()
+        prefix = os.path.basename(fname)[:LOCK_PREFIX_LENGTH]
+        path = os.path.join(self._dir, prefix + LOCK_SUFFIX)
+        with open(path, 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def _write_file(self, fname, expiry, value):
+        """Заменяет файл ключа целиком, как set()."""
+
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        renamed = False
+        try:
+            with open(fd, 'wb') as f:
+                f.write(pickle.dumps(expiry, self.pickle_protocol))
+                f.write(zlib.compress(
+                    pickle.dumps(value, self.pickle_protocol)
+                ))
+            file_move_safe(tmp_path, fname, allow_overwrite=True)
+            renamed = True
+        finally:
+            if not renamed:
+                os.remove(tmp_path)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(self._key_to_file(key, version)):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        """Увеличивает значение, сохраняя срок жизни ключа."""
+
+        fname = self._key_to_file(key, version)
+        with self._locked(fname):
+            try:
+                with open(fname, 'rb') as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (FileNotFoundError, EOFError):
+                expiry = 0
+            if expiry is not None and expiry < time.time():
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self._write_file(fname, expiry, value)
+        return value
+
+    def _cull(self):
+        now = time.monotonic()
+        if (
+            self._culled_at is not None
+            and now - self._culled_at < self._cull_interval
+        ):
+            return
+        self._culled_at = now
+        super()._cull()
@@ -0,0 +1,74 @@
+import re
+import threading
+from collections import Counter
+
+from core import instrumentation
+
+KEY_PREFIX_RE = re.compile(r'[:|]')
+
+
+def key_prefix(key):
+    """Префикс ключа до первого разделителя: 'page', 'post_card' и т.п."""
+
+    return KEY_PREFIX_RE.split(str(key), 1)[0]
+
+
+class CacheMetrics:
+    """Счётчики попаданий и промахов кеша по префиксам ключей.
+
+    Счётчики ведутся в памяти процесса, каждый воркер считает свои.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def record(self, key, hit):
+        prefix = key_prefix(key)
+        with self._lock:
+            if hit:
+                self.hits[prefix] += 1
+            else:
+                self.misses[prefix] += 1
+        instrumentation.count('cache_hit' if hit else 'cache_miss')
+
+    def snapshot(self):
+        """Возвращает {префикс: {'hits', 'misses', 'hit_ratio'}}."""
+
+        with self._lock:
+            hits, misses = dict(self.hits), dict(self.misses)
+        stats = {}
+        for prefix in sorted(set(hits) | set(misses)):
+            prefix_hits = hits.get(prefix, 0)
+            total = prefix_hits + misses.get(prefix, 0)
+            stats[prefix] = {
+                'hits': prefix_hits,
+                'misses': misses.get(prefix, 0),
+                'hit_ratio': prefix_hits / total,
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+
+
+cache_metrics = CacheMetrics()
+
+
+@instrumentation.registry.collector
+def cache_counters():
+    """Счётчики кеша в формате Prometheus по префиксам ключей."""
+
+    hits = instrumentation.CounterMetric(
+        'yatube_cache_hits_total', 'Попадания в кеш.', ('prefix',)
+    )
+    misses = instrumentation.CounterMetric(
+        'yatube_cache_misses_total', 'Промахи кеша.', ('prefix',)
+    )
+    for prefix, stats in cache_metrics.snapshot().items():
+        hits.inc(prefix, value=stats['hits'])
+        misses.inc(prefix, value=stats['misses'])
+    return hits, misses
@@ -0,0 +1,200 @@
+import pickle
+import socket
+import threading
+from urllib.parse import urlparse
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import cache_metrics
+
+
+class RedisError(Exception):
+    """Сервер вернул ошибку в ответ на команду."""
+
+
+class RedisConnection:
+    """Соединение с сервером по протоколу RESP2 без сторонних библиотек."""
+
+    def __init__(self, host, port, db=0, timeout=None):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.reader = self.sock.makefile('rb')
+        if db:
+            self.execute('SELECT', db)
+
+    def execute(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(parts))
+        return self.read_reply()
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Соединение с сервером кеша закрыто')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            return self.reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RedisError(f'Неизвестный ответ сервера: {line!r}')
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisCache(BaseCache):
+    """Кеш на сервере с протоколом Redis, общий для всех воркеров.
+
+    LOCATION задаётся как ``redis://host:port/db``. Целые числа хранятся
+    как есть, чтобы incr() выполнялся на сервере, остальное — в pickle.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        url = urlparse(location)
+        self.host = url.hostname or '127.0.0.1'
+        self.port = url.port or 6379
+        self.db = int(url.path.lstrip('/') or 0)
+        self.socket_timeout = params.get('OPTIONS', {}).get('SOCKET_TIMEOUT')
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = RedisConnection(
+                self.host, self.port, self.db, self.socket_timeout
+            )
+            self._local.connection = connection
+        return connection
+
+    def execute(self, *args):
+        try:
+            return self.connection.execute(*args)
+        except (ConnectionError, socket.timeout):
+            self.disconnect()
+            raise
+
+    def encode(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value).encode()
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def ttl_args(self, timeout):
+        """Аргументы времени жизни для SET; None — ключ уже истёк."""
+
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return ()
+        milliseconds = int(timeout * 1000)
+        if milliseconds <= 0:
+            return None
+        return ('PX', milliseconds)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        ttl = self.ttl_args(timeout)
+        if ttl is None:
+            return False
+        return self.execute('SET', key, self.encode(value), *ttl, 'NX') == 'OK'
+
+    def get(self, key, default=None, version=None):
+        raw_key = key
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        value = self.execute('GET', key)
+        cache_metrics.record(raw_key, value is not None)
+        return default if value is None else self.decode(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        ttl = self.ttl_args(timeout)
+        if ttl is None:
+            self.execute('DEL', key)
+        else:
+            self.execute('SET', key, self.encode(value), *ttl)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        ttl = self.ttl_args(timeout)
+        if ttl is None:
+            return bool(self.execute('DEL', key))
+        if not ttl:
+            self.execute('PERSIST', key)
+            return bool(self.execute('EXISTS', key))
+        return bool(self.execute('PEXPIRE', key, ttl[1]))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self.execute('DEL', key)
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version) for key in keys]
+        if keys:
+            self.execute('DEL', *keys)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.execute(
+            'MGET', *(self.make_key(key, version) for key in keys)
+        )
+        found = {}
+        for key, value in zip(keys, values):
+            cache_metrics.record(key, value is not None)
+            if value is not None:
+                found[key] = self.decode(value)
+        return found
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return bool(self.execute('EXISTS', key))
+
+    def incr(self, key, delta=1, version=None):
+        if not self.has_key(key, version):
+            raise ValueError(f"Key '{key}' not found")
+        try:
+            return self.execute('INCRBY', self.make_key(key, version), delta)
+        except RedisError as error:
+            raise ValueError(str(error)) from error
+
+    def clear(self):
+        self.execute('FLUSHDB')
+
+    def close(self, **kwargs):
+        """Соединение переиспользуется между запросами и не закрывается."""
+
+    def disconnect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,83 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.QUERY_THREADS,
+                thread_name_prefix='queries'
+            )
+    return _executor
+
+
+def _call(func):
+    # Потоков пула немного, и они держат свои соединения открытыми
+    # независимо от CONN_MAX_AGE: иначе каждая функция открывала бы
+    # новое соединение. Закрываются только соединения после ошибок,
+    # если они стали непригодны. Запросы замеряются теми же обёртками,
+    # что и запросы потока, запустившего функцию.
+    try:
+        with instrumentation.inherited_query_wrappers():
+            return func()
+    finally:
+        for connection in connections.all():
+            if not connection.errors_occurred:
+                continue
+            if connection.is_usable():
+                connection.errors_occurred = False
+            else:
+                connection.close()
+
+
+def run_concurrently(*funcs):
+    """Выполняет независимые функции с запросами к базе одновременно.
+
+    Первая функция выполняется в текущем потоке, остальные — в пуле
+    из QUERY_THREADS потоков со своими соединениями. Результаты
+    возвращаются в порядке функций. Без пула или внутри транзакции,
+    данные которой другие соединения не видят, функции выполняются
+    по очереди.
+    """
+
+    in_transaction = any(
+        connection.in_atomic_block for connection in connections.all()
+    )
+    if settings.QUERY_THREADS < 1 or len(funcs) < 2 or in_transaction:
+        return [func() for func in funcs]
+
+    executor = get_executor()
+    # Потоки пула получают копию контекста: в ней, например, выбранная
+    # для запроса реплика базы.
+    futures = [
+        executor.submit(contextvars.copy_context().run, _call, func)
+        for func in funcs[1:]
+    ]
+    first = funcs[0]()
+    return [first] + [future.result() for future in futures]
+
+
+def run_in_background(func):
+    """Запускает функцию с запросами к базе в пуле, не дожидаясь её.
+
+    Без пула или внутри транзакции функция выполняется сразу.
+    """
+
+    in_transaction = any(
+        connection.in_atomic_block for connection in connections.all()
+    )
+    if settings.QUERY_THREADS < 1 or in_transaction:
+        func()
+        return
+    get_executor().submit(contextvars.copy_context().run, _call, func)
@@ -0,0 +1,79 @@
+import random
+import sqlite3
+import time
+
+from django.db.backends.sqlite3 import base
+
+# Постоянные настройки соединения для небольших продакшен-установок:
+# WAL не блокирует чтение записью, NORMAL синхронизирует диск только
+# при контрольных точках WAL, mmap читает базу без копирования.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+}
+BUSY_RETRIES = 5
+BUSY_BACKOFF = 0.01
+BUSY_MESSAGES = ('database is locked', 'database table is locked')
+
+
+def is_busy(error):
+    return str(error).startswith(BUSY_MESSAGES)
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    """Повторяет запрос, если база занята, с растущей паузой."""
+
+    retries = BUSY_RETRIES
+
+    def execute(self, query, params=None):
+        return self.retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self.retry(super().executemany, query, param_list)
+
+    def retry(self, method, *args):
+        attempt = 0
+        while True:
+            try:
+                return method(*args)
+            except sqlite3.OperationalError as error:
+                if attempt >= self.retries or not is_busy(error):
+                    raise
+            time.sleep(BUSY_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, настроенный для одновременной записи из нескольких потоков.
+
+    Включает прагмы DEFAULT_PRAGMAS, начинает транзакции с BEGIN
+    IMMEDIATE и повторяет запросы к занятой базе. В OPTIONS можно
+    задать ``pragmas`` (дополняют DEFAULT_PRAGMAS) и ``busy_retries``.
+    """
+
+    pragmas = DEFAULT_PRAGMAS
+    busy_retries = BUSY_RETRIES
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop('pragmas', {})}
+        self.busy_retries = params.pop('busy_retries', BUSY_RETRIES)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.retries = self.busy_retries
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        # Отложенная транзакция берёт блокировку записи только на первой
+        # записи и тогда получает «database is locked» без ожидания, если
+        # пишет кто-то ещё. BEGIN IMMEDIATE ждёт блокировку сразу.
+        self.cursor().execute('BEGIN IMMEDIATE')
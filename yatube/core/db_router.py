@@ -0,0 +1,105 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY_COOKIE = 'use_primary'
+
+_state = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Маршрутизация запросов к базе в рамках одного запроса к сайту."""
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.read_only = False
+        self.wrote = False
+        replicas = settings.REPLICA_DATABASES
+        self.replica = random.choice(replicas) if replicas else None
+
+    def read_database(self):
+        if self.read_only and self.replica and not (
+            self.pinned or self.wrote
+        ):
+            return self.replica
+        return DEFAULT_DB_ALIAS
+
+
+def start(pinned=False):
+    """Начинает маршрутизацию запроса, возвращает токен для finish."""
+
+    return _state.set(RoutingState(pinned))
+
+
+def finish(token):
+    """Завершает маршрутизацию запроса и возвращает её состояние."""
+
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def replica_reads(view):
+    """Разрешает view читать из реплики на время GET и HEAD.
+
+    Чтение идёт с основной базы, если пользователь недавно что-то
+    записал или запись уже была в этом запросе.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _state.get()
+        if state is None or request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        state.read_only = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            state.read_only = False
+
+    return wrapper
+
+
+@contextmanager
+def primary_reads():
+    """Отправляет чтения внутри блока в основную базу."""
+
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    pinned = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = pinned
+
+
+class ReplicaRouter:
+    """Отправляет чтения view с replica_reads в реплики, остальное — в
+    основную базу.
+
+    Одна реплика выбирается на весь запрос, чтобы страница не собиралась
+    из данных с разным отставанием.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return state.read_database() if state else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,260 @@
+import bisect
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+
+BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+# Контекст копируется в потоки пула core.concurrency, поэтому запросы
+# к базе оттуда попадают в замеры и обёртки запроса к сайту.
+_timings = ContextVar('request_timings', default=None)
+_query_wrappers = ContextVar('query_wrappers', default=())
+
+
+class RequestTimings:
+    """Время и счётчики одного запроса для заголовка Server-Timing."""
+
+    def __init__(self):
+        self.durations = Counter()
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, count=1):
+        with self._lock:
+            self.durations[name] += seconds
+            self.counts[name] += count
+
+    def increment(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def server_timing(self, total):
+        """Значение заголовка Server-Timing, время в миллисекундах."""
+
+        parts = [f'total;dur={total * 1000:.1f}']
+        for name in sorted(self.durations):
+            parts.append(
+                f'{name};dur={self.durations[name] * 1000:.1f};'
+                f'desc="{self.counts[name]}"'
+            )
+        hits, misses = self.counts['cache_hit'], self.counts['cache_miss']
+        if hits or misses:
+            parts.append(f'cache;desc="hits={hits} misses={misses}"')
+        return ', '.join(parts)
+
+
+def current():
+    """Замеры текущего запроса или None, если запрос не в выборке."""
+
+    return _timings.get()
+
+
+@contextmanager
+def recording():
+    """Собирает замеры запроса в RequestTimings на время блока."""
+
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def count(name):
+    """Увеличивает счётчик текущего запроса, если он в выборке."""
+
+    timings = current()
+    if timings is not None:
+        timings.increment(name)
+
+
+def _wrap_connections(stack, wrappers):
+    for connection in connections.all():
+        for wrapper in wrappers:
+            stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+@contextmanager
+def wrapping_queries(*wrappers):
+    """Ставит обёртки execute на запросы ко всем базам внутри блока.
+
+    Обёртки запоминаются в контексте: потоки пула core.concurrency
+    ставят их и на свои соединения.
+    """
+
+    token = _query_wrappers.set(_query_wrappers.get() + wrappers)
+    try:
+        with ExitStack() as stack:
+            _wrap_connections(stack, wrappers)
+            yield
+    finally:
+        _query_wrappers.reset(token)
+
+
+@contextmanager
+def inherited_query_wrappers():
+    """Ставит на соединения текущего потока обёртки из контекста."""
+
+    with ExitStack() as stack:
+        _wrap_connections(stack, _query_wrappers.get())
+        yield
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с метками."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self._sums = Counter()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._series[labels][index] += 1
+            self._sums[labels] += value
+
+    def samples(self):
+        """Строки выгрузки: (суффикс имени, метки, значение)."""
+
+        with self._lock:
+            series = {
+                labels: list(counts)
+                for labels, counts in self._series.items()
+            }
+            sums = dict(self._sums)
+        for labels, counts in sorted(series.items()):
+            label_dict = dict(zip(self.label_names, labels))
+            total = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                total += bucket_count
+                yield '_bucket', {**label_dict, 'le': bound}, total
+            yield '_sum', label_dict, sums[labels]
+            yield '_count', label_dict, total
+
+
+class CounterMetric:
+    """Счётчик в формате Prometheus с метками."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = Counter()
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] += value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield '', dict(zip(self.label_names, labels)), value
+
+
+class Registry:
+    """Метрики процесса. Каждый воркер ведёт и отдаёт свои."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def histogram(self, name, help_text, label_names=()):
+        return self.metrics.setdefault(
+            name, Histogram(name, help_text, label_names)
+        )
+
+    def counter(self, name, help_text, label_names=()):
+        return self.metrics.setdefault(
+            name, CounterMetric(name, help_text, label_names)
+        )
+
+    def collector(self, func):
+        """Регистрирует функцию, которая отдаёт метрики при выгрузке."""
+
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+
+        metrics = list(self.metrics.values())
+        for collector in self.collectors:
+            metrics.extend(collector())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                pairs = ','.join(
+                    f'{name}="{format_label(label)}"'
+                    for name, label in labels.items()
+                )
+                label_text = f'{{{pairs}}}' if pairs else ''
+                lines.append(f'{metric.name}{suffix}{label_text} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"')
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'yatube_request_duration_seconds',
+    'Время обработки запроса.',
+    ('view',),
+)
+db_duration = registry.histogram(
+    'yatube_db_duration_seconds',
+    'Время запросов к базе за один запрос из выборки.',
+    ('view',),
+)
+db_queries = registry.counter(
+    'yatube_db_queries_total',
+    'Число запросов к базе в запросах из выборки.',
+    ('view',),
+)
+template_duration = registry.histogram(
+    'yatube_template_duration_seconds',
+    'Время рендера шаблонов за один запрос из выборки.',
+    ('view',),
+)
+thumbnail_duration = registry.histogram(
+    'yatube_thumbnail_duration_seconds',
+    'Время создания миниатюр одного изображения.',
+)
+
+
+@contextmanager
+def timed(name, histogram=None):
+    """Замеряет блок для Server-Timing и, если задана, для гистограммы."""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = current()
+        if timings is not None:
+            timings.add(name, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed)
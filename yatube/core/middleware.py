@@ -0,0 +1,109 @@
+import random
+import time
+
+from django.conf import settings
+
+from . import db_router, instrumentation
+from .query_log import NPlusOneError, logger, query_log
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unknown'
+
+
+class MetricsMiddleware:
+    """Замеряет время запросов для гистограмм и заголовка Server-Timing.
+
+    Время обработки учитывается у каждого запроса. Запросы к базе, кеш
+    и шаблоны замеряются только у доли METRICS_SAMPLE_RATE запросов,
+    чтобы обёртки не замедляли остальные.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            response = self.get_response(request)
+            instrumentation.request_duration.observe(
+                time.perf_counter() - start, view_name(request)
+            )
+            return response
+
+        with instrumentation.recording() as timings:
+            with instrumentation.wrapping_queries(self.time_query):
+                response = self.get_response(request)
+        total = time.perf_counter() - start
+        self.observe(view_name(request), total, timings)
+        response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        with instrumentation.timed('db'):
+            return execute(sql, params, many, context)
+
+    @staticmethod
+    def observe(view, total, timings):
+        instrumentation.request_duration.observe(total, view)
+        instrumentation.db_duration.observe(timings.durations['db'], view)
+        instrumentation.db_queries.inc(view, value=timings.counts['db'])
+        instrumentation.template_duration.observe(
+            timings.durations['template'], view
+        )
+
+
+class QueryLogMiddleware:
+    """Ищет повторяющиеся и медленные запросы к базе.
+
+    Включается настройкой QUERY_LOG. Повторы пишутся в лог
+    yatube.queries, а при N_PLUS_ONE_RAISE — вызывают NPlusOneError.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_LOG:
+            return self.get_response(request)
+
+        with query_log() as log:
+            response = self.get_response(request)
+        if log.repeated():
+            message = f'{request.method} {request.path}\n{log.report()}'
+            if settings.N_PLUS_ONE_RAISE:
+                raise NPlusOneError(message)
+            logger.warning('Повторяющиеся запросы: %s', message)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Ведёт маршрутизацию чтений между основной базой и репликами.
+
+    После записи клиент получает куку, и следующие REPLICA_PIN_SECONDS
+    секунд его запросы читают с основной базы: он видит свои изменения,
+    даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = db_router.start(
+            pinned=db_router.PRIMARY_COOKIE in request.COOKIES
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            state = db_router.finish(token)
+        if state.wrote:
+            response.set_cookie(
+                db_router.PRIMARY_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,138 @@
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import Lock
+
+from django.conf import settings
+from django.template.base import Node
+
+from .instrumentation import wrapping_queries
+
+logger = logging.getLogger('yatube.queries')
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r'\(\s*(?:(?:%s|\?)\s*,\s*)*(?:%s|\?)\s*\)')
+RENDER_CODE = Node.render_annotated.__code__
+THIS_FILE = os.path.abspath(__file__)
+
+
+class NPlusOneError(AssertionError):
+    """Один и тот же запрос повторяется в обработке одного запроса."""
+
+
+def query_shape(sql):
+    """Запрос без значений: литералы и списки IN заменены заглушками."""
+
+    return VALUE_LIST.sub('(...)', LITERAL.sub('?', sql))
+
+
+def query_origin():
+    """Откуда выполнен запрос: строка шаблона и код проекта.
+
+    Для запроса из шаблона возвращается 'шаблон:строка', а если его
+    выполнил код проекта (тег, метод модели) — ещё и 'файл:строка'.
+    """
+
+    template = code = None
+    frame = sys._getframe(1)
+    while frame is not None and template is None:
+        filename = frame.f_code.co_filename
+        if frame.f_code is RENDER_CODE:
+            node = frame.f_locals['self']
+            name = node.origin.template_name or node.origin.name
+            template = f'{name}:{node.token.lineno}'
+        elif (code is None and filename.startswith(settings.BASE_DIR)
+              and filename != THIS_FILE):
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            code = f'{path}:{frame.f_lineno} {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ' ← '.join(filter(None, (code, template))) or 'unknown'
+
+
+class QueryLog:
+    """Обёртка execute, группирующая запросы по виду.
+
+    Место вызова ищется только для повторов и медленных запросов,
+    остальные запросы обходятся подсчётом.
+    """
+
+    def __init__(self, threshold=None, slow_ms=None):
+        self.threshold = threshold or settings.N_PLUS_ONE_THRESHOLD
+        self.slow_ms = settings.SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self.shapes = Counter()
+        self.origins = defaultdict(Counter)
+        self.slow = []
+        self._lock = Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, (time.perf_counter() - start) * 1000)
+
+    def record(self, sql, milliseconds):
+        shape = query_shape(sql)
+        with self._lock:
+            self.shapes[shape] += 1
+            repeated = self.shapes[shape] > 1
+        if repeated:
+            origin = query_origin()
+            with self._lock:
+                self.origins[shape][origin] += 1
+        if milliseconds >= self.slow_ms:
+            origin = query_origin()
+            with self._lock:
+                self.slow.append((milliseconds, sql, origin))
+            logger.warning(
+                'Медленный запрос %.1f мс (%s): %s', milliseconds, origin, sql
+            )
+
+    def repeated(self):
+        """Виды запросов, выполненные не меньше threshold раз."""
+
+        return [
+            (shape, count, self.origins[shape])
+            for shape, count in self.shapes.most_common()
+            if count >= self.threshold
+        ]
+
+    def report(self):
+        lines = []
+        for shape, count, origins in self.repeated():
+            lines.append(f'{count} раз: {shape}')
+            lines.extend(
+                f'    {origin} ×{origin_count}'
+                for origin, origin_count in origins.most_common()
+            )
+        return '\n'.join(lines)
+
+
+@contextmanager
+def query_log(threshold=None, slow_ms=None):
+    """Записывает запросы ко всем базам внутри блока в QueryLog.
+
+    Запросы из потоков пула core.concurrency тоже записываются.
+    """
+
+    log = QueryLog(threshold, slow_ms)
+    with wrapping_queries(log):
+        yield log
+
+
+@contextmanager
+def assert_no_n_plus_one(threshold=None):
+    """Падает, если внутри блока запрос повторился threshold раз.
+
+    В сообщении перечислены строки шаблонов и кода, откуда
+    выполнялись повторы.
+    """
+
+    with query_log(threshold) as log:
+        yield log
+    if log.repeated():
+        raise NPlusOneError('Повторяющиеся запросы:\n' + log.report())
@@ -0,0 +1,70 @@
+import re
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)(?P<rest>.*)$')
+TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+
+class QueryPlanError(AssertionError):
+    """План запроса читает таблицу целиком или сортирует всю выборку."""
+
+
+def explain(sql, using=DEFAULT_DB_ALIAS):
+    """Строки плана EXPLAIN QUERY PLAN для запроса SQLite."""
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(sql, allowed_tables=(), allow_sorts=True,
+                  using=DEFAULT_DB_ALIAS):
+    """Недостатки плана запроса: полные просмотры таблиц и сортировки.
+
+    Проход по индексу (``USING INDEX``) и по виртуальной таблице
+    полнотекстового поиска полным просмотром не считается.
+    """
+
+    problems = []
+    for detail in explain(sql, using):
+        if detail == TEMP_SORT and not allow_sorts:
+            problems.append('сортировка без индекса')
+            continue
+        match = FULL_SCAN.match(detail)
+        if not match or match['table'] in allowed_tables:
+            continue
+        if ' USING ' in match['rest'] or 'VIRTUAL TABLE' in match['rest']:
+            continue
+        problems.append(f'полный просмотр {match["table"]}')
+    return problems
+
+
+@contextmanager
+def assert_query_plans(allowed_tables=(), allow_sorts=True,
+                       using=DEFAULT_DB_ALIAS):
+    """Проверяет планы всех SELECT, выполненных внутри блока.
+
+    Падает, если запрос просматривает таблицу целиком, а при
+    ``allow_sorts=False`` — и если сортирует выборку без индекса.
+    Работает на SQLite, на других базах проверка пропускается.
+    """
+
+    connection = connections[using]
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if connection.vendor != 'sqlite':
+        return
+
+    errors = []
+    for query in context.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        problems = plan_problems(sql, allowed_tables, allow_sorts, using)
+        if problems:
+            errors.append(f'{", ".join(problems)}: {sql}')
+    if errors:
+        raise QueryPlanError('Неудачные планы запросов:\n' + '\n'.join(errors))
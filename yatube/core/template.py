@@ -0,0 +1,29 @@
+from django.template.backends.django import DjangoTemplates, Template
+
+from .instrumentation import timed
+
+
+class TimedTemplate(Template):
+    """Шаблон, время рендера которого попадает в замеры запроса."""
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates, отдающий TimedTemplate.
+
+    Замеряется только рендер верхнего шаблона: include и extends
+    выполняются внутри него и второй раз не учитываются.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self
+        )
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self
+        )
@@ -0,0 +1,494 @@
+import asyncio
+import multiprocessing
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.db import (
+    DEFAULT_DB_ALIAS, OperationalError, connection, connections, router
+)
+from django.db.utils import load_backend
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+
+from core.asgi import ASGIHandler
+from core.cache.backends import MeteredFileBasedCache, MeteredLocMemCache
+from core.cache.metrics import cache_metrics
+from core.cache.redis import RedisCache
+from core import db_router, instrumentation
+from core.concurrency import run_concurrently
+from core.middleware import MetricsMiddleware
+from core.query_log import (
+    NPlusOneError,
+    assert_no_n_plus_one,
+    query_log,
+    query_shape,
+)
+from core.query_plan import QueryPlanError, assert_query_plans
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Обрабатывает команды, которые использует RedisCache."""
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def reply(self, value):
+        if value is None:
+            self.wfile.write(b'$-1\r\n')
+        elif isinstance(value, int):
+            self.wfile.write(b':%d\r\n' % value)
+        elif isinstance(value, list):
+            self.wfile.write(b'*%d\r\n' % len(value))
+            for item in value:
+                self.reply(item)
+        elif value == 'OK':
+            self.wfile.write(b'+OK\r\n')
+        else:
+            self.wfile.write(b'$%d\r\n%s\r\n' % (len(value), value))
+
+    def lookup(self, key):
+        value, expires = self.server.data.get(key, (None, None))
+        if expires is not None and expires <= time.time():
+            self.server.data.pop(key, None)
+            return None
+        return value
+
+    def handle(self):
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command, args = args[0].upper().decode(), args[1:]
+            self.reply(getattr(self, f'do_{command.lower()}')(*args))
+
+    def do_select(self, db):
+        return 'OK'
+
+    def do_get(self, key):
+        return self.lookup(key)
+
+    def do_mget(self, *keys):
+        return [self.lookup(key) for key in keys]
+
+    def do_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if b'NX' in options and self.lookup(key) is not None:
+            return None
+        expires = None
+        if b'PX' in options:
+            milliseconds = int(options[options.index(b'PX') + 1])
+            expires = time.time() + milliseconds / 1000
+        self.server.data[key] = (value, expires)
+        return 'OK'
+
+    def do_del(self, *keys):
+        return sum(self.server.data.pop(key, None) is not None for key in keys)
+
+    def do_exists(self, key):
+        return int(self.lookup(key) is not None)
+
+    def do_incrby(self, key, delta):
+        value = int(self.lookup(key) or 0) + int(delta)
+        self.server.data[key] = (str(value).encode(), None)
+        return value
+
+    def do_flushdb(self):
+        self.server.data.clear()
+        return 'OK'
+
+
+class RedisCacheTest(SimpleTestCase):
+    """Тестирование кеша с протоколом Redis на локальном сервере-заглушке."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), FakeRedisHandler
+        )
+        cls.server.daemon_threads = True
+        cls.server.data = {}
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        host, port = self.server.server_address
+        self.cache = RedisCache(f'redis://{host}:{port}/1', {})
+        self.cache.clear()
+
+    def test_set_get_and_delete(self):
+        """Значения сохраняются, читаются и удаляются."""
+
+        self.cache.set('page:1', {'content': b'<html>'})
+        self.assertEqual(self.cache.get('page:1'), {'content': b'<html>'})
+        self.assertEqual(
+            self.cache.get_many(['page:1', 'page:2']),
+            {'page:1': {'content': b'<html>'}}
+        )
+        self.cache.delete('page:1')
+        self.assertIsNone(self.cache.get('page:1'))
+
+    def test_add_and_incr(self):
+        """add() не перезаписывает ключ, incr() работает на сервере."""
+
+        self.assertTrue(self.cache.add('page_version:index', 1, None))
+        self.assertFalse(self.cache.add('page_version:index', 5, None))
+        self.assertEqual(self.cache.incr('page_version:index'), 2)
+        self.assertEqual(self.cache.get('page_version:index'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('page_version:missing')
+
+    def test_timeout(self):
+        """Ключ с истёкшим временем жизни не возвращается."""
+
+        self.cache.set('post_card:1:index', 'html', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('post_card:1:index'))
+
+
+def bump_file_cache(location, times):
+    file_cache = MeteredFileBasedCache(location, {})
+    added = file_cache.add('page_lock:index', os.getpid(), None)
+    for _ in range(times):
+        file_cache.incr('page_version:index')
+    return added
+
+
+class FileBasedCacheTest(SimpleTestCase):
+    """Тестирование кеша в файлах, общего для процессов."""
+
+    def setUp(self):
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        self.location = location.name
+        self.cache = MeteredFileBasedCache(self.location, {})
+
+    def test_add_and_incr_atomic_across_processes(self):
+        """add() удаётся одному процессу, incr() не теряет увеличений."""
+
+        self.cache.set('page_version:index', 0, None)
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            added = pool.starmap(bump_file_cache, [(self.location, 25)] * 4)
+
+        self.assertEqual(added.count(True), 1)
+        self.assertEqual(self.cache.get('page_version:index'), 100)
+
+    def test_incr_keeps_timeout(self):
+        """incr() не меняет срок жизни ключа."""
+
+        self.cache.set('page_version:index', 1, 0.2)
+        self.assertEqual(self.cache.incr('page_version:index'), 2)
+        time.sleep(0.3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('page_version:index')
+
+
+class CacheMetricsTest(SimpleTestCase):
+    """Тестирование счётчиков попаданий в кеш."""
+
+    def setUp(self):
+        cache_metrics.reset()
+        self.cache = MeteredLocMemCache('metrics-test', {})
+
+    def test_hit_ratio_by_prefix(self):
+        """Попадания и промахи считаются отдельно для каждого префикса."""
+
+        self.cache.set('post_card:1:index', 'html')
+        self.cache.get('post_card:1:index')
+        self.cache.get('post_card:2:index')
+        self.cache.get('page:index:0:hash')
+
+        stats = cache_metrics.snapshot()
+        self.assertEqual(stats['post_card']['hits'], 1)
+        self.assertEqual(stats['post_card']['misses'], 1)
+        self.assertEqual(stats['post_card']['hit_ratio'], 0.5)
+        self.assertEqual(stats['page']['hit_ratio'], 0)
+
+
+class QueryPlanTest(TestCase):
+    """Тестирование проверки планов запросов."""
+
+    def test_full_scan_detected(self):
+        """Запрос по полю без индекса считается ошибкой."""
+
+        users = get_user_model().objects
+        with assert_query_plans():
+            users.filter(username='admin').exists()
+        with self.assertRaises(QueryPlanError):
+            with assert_query_plans():
+                users.filter(first_name='Иван').exists()
+        with assert_query_plans(allowed_tables=['auth_user']):
+            users.filter(first_name='Иван').exists()
+
+    def test_sort_without_index_detected(self):
+        """Сортировка без индекса — ошибка, если она запрещена."""
+
+        users = get_user_model().objects.filter(id__gt=0)
+        with assert_query_plans():
+            list(users.order_by('last_name'))
+        with self.assertRaises(QueryPlanError):
+            with assert_query_plans(allow_sorts=False):
+                list(users.order_by('last_name'))
+
+
+class MetricsMiddlewareTest(TestCase):
+    """Тестирование замеров запросов."""
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_server_timing_header(self):
+        """Запрос из выборки получает время базы, шаблонов и кеша."""
+
+        response = self.client.get('/')
+        timing = response['Server-Timing']
+        for name in ('total;dur=', 'db;dur=', 'template;dur=', 'cache;'):
+            self.assertIn(name, timing)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_metrics_endpoint(self):
+        """Гистограммы отдаются в формате Prometheus только своим."""
+
+        response = self.client.get('/')
+        self.assertNotIn('Server-Timing', response)
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="posts:index",',
+            response.content.decode()
+        )
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryLogTest(TestCase):
+    """Тестирование поиска повторяющихся запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.bulk_create(
+            get_user_model()(username=f'user{number}') for number in range(5)
+        )
+
+    def test_query_shape(self):
+        """Запросы с разными значениями считаются одинаковыми."""
+
+        self.assertEqual(
+            query_shape("SELECT 1 WHERE id IN (%s, %s) AND name = 'a'"),
+            query_shape("SELECT 2 WHERE id IN (%s) AND name = 'b'"),
+        )
+
+    def test_repeats_attributed_to_template(self):
+        """Повтор запроса указывает на строку шаблона."""
+
+        template = Template(
+            '{% for user in users %}\n{{ user.groups.count }}{% endfor %}'
+        )
+        users = get_user_model().objects.all()
+        with self.assertRaisesMessage(NPlusOneError, ':2 ×4'):
+            with assert_no_n_plus_one(threshold=5):
+                template.render(Context({'users': users}))
+        with assert_no_n_plus_one(threshold=5):
+            template.render(Context({'users': users[:3]}))
+
+
+class ASGIHandlerTest(SimpleTestCase):
+    """Тестирование обработчика ASGI."""
+
+    def request(self, path, method='GET', body=b''):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'host', b'testserver')],
+            'client': ('127.0.0.1', 50000),
+        }
+        asyncio.run(ASGIHandler()(scope, receive, send))
+        start, *chunks = messages
+        self.assertFalse(chunks[-1].get('more_body'))
+        return start, b''.join(chunk['body'] for chunk in chunks)
+
+    def test_response(self):
+        """Ответ Django передаётся статусом, заголовками и телом."""
+
+        start, body = self.request('/about/author/')
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/html; charset=utf-8'), start['headers']
+        )
+        self.assertIn('</html>', body.decode())
+
+    def test_not_found(self):
+        start, _ = self.request('/нет-такой-страницы/')
+        self.assertEqual(start['status'], 404)
+
+
+class RunConcurrentlyTest(SimpleTestCase):
+    """Тестирование одновременного выполнения запросов."""
+
+    @override_settings(QUERY_THREADS=2)
+    def test_results_in_order(self):
+        """Функции выполняются в разных потоках, порядок сохраняется."""
+
+        results = run_concurrently(
+            threading.current_thread, threading.current_thread, lambda: 3
+        )
+        self.assertIs(results[0], threading.current_thread())
+        self.assertIsNot(results[1], threading.current_thread())
+        self.assertEqual(results[2], 3)
+
+    @override_settings(QUERY_THREADS=2)
+    def test_pool_keeps_connections(self):
+        """Потоки пула не закрывают соединение после каждой функции."""
+
+        def connect():
+            connections[DEFAULT_DB_ALIAS].ensure_connection()
+            return connections[DEFAULT_DB_ALIAS]
+
+        with mock.patch.object(
+            type(connections[DEFAULT_DB_ALIAS]), 'close', autospec=True
+        ) as close:
+            _, pool_connection = run_concurrently(lambda: None, connect)
+        self.assertIsNotNone(pool_connection.connection)
+        close.assert_not_called()
+
+    @override_settings(QUERY_THREADS=2)
+    def test_pool_queries_measured(self):
+        """Запросы из потоков пула попадают в замеры и журнал запросов."""
+
+        def query():
+            with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        with instrumentation.recording() as timings, query_log() as log:
+            with instrumentation.wrapping_queries(
+                MetricsMiddleware.time_query
+            ):
+                run_concurrently(lambda: None, query)
+        self.assertEqual(timings.counts['db'], 1)
+        self.assertEqual(log.shapes, {'SELECT ?': 1})
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTest(TestCase):
+    """Тестирование маршрутизации чтений в реплики."""
+
+    def read_in_view(self, pinned=False, method='get'):
+        """Базы чтения в view с replica_reads: до записи и после неё."""
+
+        @db_router.replica_reads
+        def view(request):
+            aliases = [router.db_for_read(get_user_model())]
+            router.db_for_write(get_user_model())
+            aliases.append(router.db_for_read(get_user_model()))
+            return aliases
+
+        token = db_router.start(pinned)
+        try:
+            return view(getattr(RequestFactory(), method)('/'))
+        finally:
+            db_router.finish(token)
+
+    def test_reads_from_replica_until_write(self):
+        """После записи запрос читает с основной базы."""
+
+        self.assertEqual(self.read_in_view(), ['replica', 'default'])
+        self.assertEqual(
+            self.read_in_view(method='post'), ['default', 'default']
+        )
+        self.assertEqual(router.db_for_read(get_user_model()), 'default')
+
+    def test_pinned_client_reads_primary(self):
+        """Недавно писавший клиент читает с основной базы."""
+
+        self.assertEqual(self.read_in_view(pinned=True), ['default'] * 2)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_write_sets_primary_cookie(self):
+        """Ответ на запрос с записью закрепляет клиента за основной базой."""
+
+        users = get_user_model().objects
+        self.client.force_login(users.create(username='follower'))
+        author = users.create(username='author')
+        response = self.client.get(f'/profile/{author.username}/follow/')
+        self.assertIn(db_router.PRIMARY_COOKIE, response.cookies)
+        response = self.client.get('/about/author/')
+        self.assertNotIn(db_router.PRIMARY_COOKIE, response.cookies)
+
+
+class SQLiteTuningTest(SimpleTestCase):
+    """Тестирование настроенного бэкенда SQLite на файле."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+
+    def database(self, **options):
+        wrapper = load_backend('core.db.sqlite3').DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': self.path,
+            'OPTIONS': options,
+        }, 'tuned')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas(self):
+        """Соединение открывается в режиме WAL с synchronous=NORMAL."""
+
+        with self.database().cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_busy_database_retried(self):
+        """Запись в занятую базу повторяется, пока блокировка не снята."""
+
+        writer = self.database()
+        writer.cursor().execute('CREATE TABLE post (id INTEGER PRIMARY KEY)')
+        writer._start_transaction_under_autocommit()
+        writer.cursor().execute('INSERT INTO post DEFAULT VALUES')
+
+        with self.assertRaises(OperationalError):
+            self.database(timeout=0, busy_retries=0).cursor().execute(
+                'INSERT INTO post DEFAULT VALUES'
+            )
+        threading.Timer(0.05, writer.connection.commit).start()
+        with self.database(timeout=0, busy_retries=8).cursor() as cursor:
+            cursor.execute('INSERT INTO post DEFAULT VALUES')
+            cursor.execute('SELECT COUNT(*) FROM post')
+            self.assertEqual(cursor.fetchone()[0], 2)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Comment, Follow
+from .search import search_posts
 
 
 @admin.register(Post)
@@ -19,6 +20,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет посты по полнотекстовому индексу, а не LIKE по тексту."""
+
+        if not search_term:
+            return queryset, False
+        found = search_posts(search_term).values('id')
+        return queryset.filter(id__in=found), False
+
 
 admin.site.register(Group)
 admin.site.register(Comment)
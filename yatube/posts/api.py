@@ -0,0 +1,238 @@
+import json
+from functools import partial, wraps
+
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from core.db_router import replica_reads
+
+from .conditional import (
+    conditional_page,
+    feed_page_state,
+    group_page_state,
+    index_page_state,
+    post_page_state,
+    profile_page_state,
+)
+from .constants import (
+    COMMENT_ORDERINGS,
+    COMMENTS_ON_PAGE,
+    NUMBER_OF_POSTS_ON_PAGE,
+)
+from .feed import FeedPaginator
+from .graph import QueryError, execute
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .utils import CursorPaginator
+
+# Поля ответа и пути к ним в запросе values(): объекты моделей
+# не создаются, связанные поля берутся одним JOIN.
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+}
+STATS_FIELDS = (
+    'posts_count', 'followers_count', 'following_count', 'comments_count',
+)
+
+
+def api_error(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def api_login_required(view):
+    """Отвечает 401 вместо перенаправления на страницу входа."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_error(401, 'Требуется авторизация.')
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def requested_fields(request, available):
+    """Поля из параметра ``fields`` через запятую, без него — все."""
+
+    names = request.GET.get('fields', '').split(',')
+    fields = [name for name in available if name in names]
+    return fields or list(available)
+
+
+def serialize(rows, fields, paths):
+    """Строки values() в словари ответа с именами полей API."""
+
+    items = [{field: row[paths[field]] for field in fields} for row in rows]
+    if 'image' in fields:
+        for item in items:
+            image = item['image']
+            item['image'] = default_storage.url(image) if image else None
+    return items
+
+
+def cursor_page(request, queryset, fields, paths, per_page, ordering,
+                prefix='', paginator_class=CursorPaginator):
+    """Страница строк values() по курсору и курсоры соседних.
+
+    Поля id и ключ сортировки запрашиваются всегда: по ним строится
+    курсор. prefix добавляется к именам параметров запроса.
+    """
+
+    columns = {paths[field] for field in fields}
+    columns.update(('id', ordering.lstrip('-')))
+    paginator = paginator_class(queryset.values(*columns), per_page, ordering)
+    page = paginator.get_page(
+        request.GET.get(f'{prefix}page'),
+        cursor=request.GET.get(f'{prefix}cursor')
+    )
+    return {
+        'results': serialize(page, fields, paths),
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
+
+
+def posts_page(request, queryset, paginator_class=CursorPaginator):
+    fields = requested_fields(request, POST_FIELDS)
+    return cursor_page(
+        request, queryset, fields, POST_FIELDS,
+        NUMBER_OF_POSTS_ON_PAGE, '-created',
+        paginator_class=paginator_class,
+    )
+
+
+@replica_reads
+@conditional_page(index_page_state)
+def posts(request):
+    """Все посты, от новых к старым."""
+
+    return JsonResponse(posts_page(request, Post.objects.all()))
+
+
+@replica_reads
+@conditional_page(group_page_state)
+def group_posts(request, slug):
+    """Сообщество и его посты."""
+
+    group = Group.objects.filter(slug=slug).values(
+        'title', 'slug', 'description'
+    ).first()
+    if group is None:
+        return api_error(404, 'Сообщество не найдено.')
+
+    return JsonResponse({
+        'group': group,
+        **posts_page(request, Post.objects.filter(group__slug=slug)),
+    })
+
+
+@replica_reads
+@conditional_page(profile_page_state)
+def profile(request, username):
+    """Автор, его счётчики и посты."""
+
+    author = User.objects.select_related('stats').filter(
+        username=username
+    ).first()
+    if author is None:
+        return api_error(404, 'Пользователь не найден.')
+    stats = UserStats.for_user(author)
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author=author
+    ).exists()
+
+    return JsonResponse({
+        'author': {
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            **{field: getattr(stats, field) for field in STATS_FIELDS},
+        },
+        'following': following,
+        **posts_page(request, Post.objects.filter(author=author)),
+    })
+
+
+@replica_reads
+@conditional_page(post_page_state)
+def post_detail(request, post_id):
+    """Пост и страница его комментариев.
+
+    Порядок комментариев — параметр ``comments``, курсор —
+    ``comments_cursor``.
+    """
+
+    fields = requested_fields(request, POST_FIELDS)
+    rows = Post.objects.filter(id=post_id).values(
+        *{POST_FIELDS[field] for field in fields}
+    )[:1]
+    if not rows:
+        return api_error(404, 'Пост не найден.')
+
+    order = request.GET.get('comments')
+    if order not in COMMENT_ORDERINGS:
+        order = 'old'
+    comments = cursor_page(
+        request,
+        Comment.objects.filter(post_id=post_id),
+        list(COMMENT_FIELDS),
+        COMMENT_FIELDS,
+        COMMENTS_ON_PAGE,
+        COMMENT_ORDERINGS[order],
+        prefix='comments_',
+    )
+
+    return JsonResponse({
+        'post': serialize(rows, fields, POST_FIELDS)[0],
+        'comments': {'order': order, **comments},
+    })
+
+
+@api_login_required
+@replica_reads
+@conditional_page(feed_page_state, per_user=True)
+def follow_feed(request):
+    """Посты авторов, на которых подписан пользователь."""
+
+    return JsonResponse(posts_page(
+        request,
+        Post.objects.all(),
+        partial(FeedPaginator, user=request.user),
+    ))
+
+
+@csrf_exempt
+@replica_reads
+def query(request):
+    """Выполняет запрос с выбором полей постов и связанных объектов.
+
+    Запрос — JSON в теле POST или в параметре ``query`` GET-запроса.
+    Связанные объекты загружаются пачками, поэтому число запросов к базе
+    не зависит от числа постов в ответе.
+    """
+
+    if request.method == 'POST':
+        raw = request.body
+    else:
+        raw = request.GET.get('query', '')
+    try:
+        selection = json.loads(raw)
+    except ValueError:
+        return api_error(400, 'Запрос должен быть JSON-объектом.')
+    try:
+        data = execute(selection)
+    except QueryError as error:
+        return api_error(400, str(error))
+
+    return JsonResponse({'data': data})
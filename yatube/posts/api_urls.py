@@ -0,0 +1,15 @@
+from django.urls import path
+
+from . import api
+
+
+app_name = 'api_v1'
+
+urlpatterns = [
+    path('posts/', api.posts, name='posts'),
+    path('posts/<int:post_id>/', api.post_detail, name='post_detail'),
+    path('groups/<slug:slug>/', api.group_posts, name='group_posts'),
+    path('profiles/<str:username>/', api.profile, name='profile'),
+    path('follow/', api.follow_feed, name='follow_feed'),
+    path('query/', api.query, name='query'),
+]
@@ -5,3 +5,6 @@ class PostsConfig(AppConfig):
     """Конфигурация приложения Posts."""
 
     name = 'posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,178 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from core.db_router import primary_reads
+
+from .constants import (
+    PAGE_CACHE_LOCK_TIMEOUT,
+    PAGE_CACHE_STALE_TIMEOUT,
+    PAGE_CACHE_TIMEOUT,
+    POST_CARD_INVALIDATE_BATCH,
+)
+
+PAGE_VERSION_ALL = 'all'
+
+POST_CARD_VARIANTS = ('index', 'profile', 'group')
+VIEW_CARD_VARIANTS = {
+    'posts:profile': 'profile',
+    'posts:group_list': 'group',
+}
+
+
+def post_card_variant(request):
+    """Вариант карточки поста, зависящий от страницы, где она выводится."""
+
+    match = getattr(request, 'resolver_match', None)
+    view_name = match.view_name if match else None
+    return VIEW_CARD_VARIANTS.get(view_name, 'index')
+
+
+def post_card_key(post_id, variant):
+    return f'post_card:{post_id}:{variant}'
+
+
+def invalidate_post_cards(post_ids):
+    """Удаляет из кеша все варианты карточек указанных постов."""
+
+    keys = []
+    for post_id in post_ids:
+        keys.extend(
+            post_card_key(post_id, variant)
+            for variant in POST_CARD_VARIANTS
+        )
+        if len(keys) >= POST_CARD_INVALIDATE_BATCH:
+            cache.delete_many(keys)
+            keys = []
+    if keys:
+        cache.delete_many(keys)
+
+
+def page_version_key(scope):
+    return f'page_version:{scope}'
+
+
+def page_versions(*scopes):
+    """Текущие версии кеша страниц для указанных областей.
+
+    Отсутствующая версия заводится по текущему времени, чтобы не совпасть
+    с версией записей, сохранённых до её вытеснения из кеша.
+    """
+
+    keys = [page_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return tuple(versions[key] for key in keys)
+
+
+def page_modified_key(scope):
+    return f'page_modified:{scope}'
+
+
+def page_modified(*scopes):
+    """Время последнего изменения указанных областей в наносекундах."""
+
+    return tuple(
+        cache.get_many([page_modified_key(scope) for scope in scopes]).values()
+    )
+
+
+def bump_page_version(*scopes):
+    """Делает устаревшими закешированные страницы указанных областей.
+
+    Версия увеличивается атомарно через incr, чтобы одновременные
+    изменения не затирали друг друга. Время изменения хранится отдельно:
+    по нему выставляется Last-Modified.
+    """
+
+    now = time.time_ns()
+    for scope in scopes:
+        key = page_version_key(scope)
+        if cache.add(key, now, None):
+            continue
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, now, None)
+    cache.set_many(
+        {page_modified_key(scope): now for scope in scopes}, None
+    )
+
+
+def recently_modified(*scopes):
+    """Менялись ли области за последние REPLICA_PIN_SECONDS."""
+
+    modified = page_modified(*scopes)
+    pin = settings.REPLICA_PIN_SECONDS * 10 ** 9
+    return bool(modified) and time.time_ns() - max(modified) < pin
+
+
+def versioned_cache_page(scope):
+    """Кеширует страницу до изменения данных в её области.
+
+    Область задаётся строкой, в которую подставляются аргументы view,
+    например ``'group:{slug}'``. Устаревшую страницу пересчитывает только
+    один запрос, остальные в это время получают предыдущую версию.
+
+    Первые REPLICA_PIN_SECONDS после изменения области страница читается
+    с основной базы: иначе отстающая реплика отдала бы прежние данные,
+    и они закешировались бы под новой версией.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            page_scope = scope.format(**kwargs)
+            versions = page_versions(PAGE_VERSION_ALL, page_scope)
+            path_hash = hashlib.md5(
+                request.get_full_path().encode()
+            ).hexdigest()
+            key = f'page:{page_scope}:{request.user.pk or 0}:{path_hash}'
+            entry = cache.get(key)
+
+            if entry and entry['versions'] == versions:
+                if entry['fresh_until'] > time.time():
+                    return cached_response(entry)
+
+            lock_key = f'{key}:lock'
+            if entry and not cache.add(lock_key, 1, PAGE_CACHE_LOCK_TIMEOUT):
+                return cached_response(entry)
+
+            try:
+                if recently_modified(PAGE_VERSION_ALL, page_scope):
+                    with primary_reads():
+                        response = view(request, *args, **kwargs)
+                else:
+                    response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(key, {
+                        'versions': versions,
+                        'fresh_until': time.time() + PAGE_CACHE_TIMEOUT,
+                        'content': response.content,
+                        'headers': list(response.items()),
+                    }, PAGE_CACHE_STALE_TIMEOUT)
+            finally:
+                if entry:
+                    cache.delete(lock_key)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def cached_response(entry):
+    response = HttpResponse(entry['content'])
+    for header, value in entry['headers']:
+        response[header] = value
+    return response
@@ -0,0 +1,128 @@
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import OuterRef, Subquery
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .cache import PAGE_VERSION_ALL, page_modified, page_versions
+from .models import Comment, Post, User
+
+
+def latest_created(queryset):
+    return Subquery(
+        queryset.order_by('-created').values('created')[:1]
+    )
+
+
+def post_page_state(post_id):
+    """Области версий и отметки времени страницы поста."""
+
+    row = Post.objects.filter(id=post_id).annotate(
+        last_comment=latest_created(
+            Comment.objects.filter(post=OuterRef('pk'))
+        )
+    ).values_list('author_id', 'created', 'last_comment').first()
+    if row is None:
+        return None
+    author_id, created, last_comment = row
+    return (f'post:{post_id}', f'author:{author_id}'), (created, last_comment)
+
+
+def profile_page_state(username):
+    """Области версий и отметки времени страницы профиля."""
+
+    row = User.objects.filter(username=username).annotate(
+        last_post=latest_created(Post.objects.filter(author=OuterRef('pk')))
+    ).values_list('id', 'last_post').first()
+    if row is None:
+        return None
+    author_id, last_post = row
+    return (f'author:{author_id}',), (last_post,)
+
+
+def group_page_state(slug):
+    """Области версий и отметки времени страницы сообщества."""
+
+    last_post = Post.objects.filter(group__slug=slug).order_by(
+        '-created'
+    ).values_list('created', flat=True).first()
+    return (f'group:{slug}',), (last_post,)
+
+
+def index_page_state():
+    """Области версий и отметки времени списка всех постов."""
+
+    last_post = Post.objects.order_by('-created').values_list(
+        'created', flat=True
+    ).first()
+    return ('index',), (last_post,)
+
+
+def feed_page_state(user):
+    """Области версий ленты подписок пользователя.
+
+    Лента меняется с любым постом и с подписками пользователя.
+    """
+
+    return ('index', f'author:{user.pk}'), ()
+
+
+def page_validators(request, state):
+    """ETag и Last-Modified страницы по её версиям и отметкам времени.
+
+    ETag учитывает также пользователя, CSRF-куку и адрес с параметрами:
+    от них зависит разметка страницы.
+    """
+
+    if state is None:
+        return None, None
+    scopes, timestamps = state
+    versions = page_versions(PAGE_VERSION_ALL, *scopes)
+    modified = max(versions + page_modified(PAGE_VERSION_ALL, *scopes))
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    last_modified = max([
+        datetime.fromtimestamp(modified / 10 ** 9, timezone.utc),
+        *timestamps
+    ])
+    etag = hashlib.md5(repr((
+        versions,
+        timestamps,
+        request.user.pk,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        request.get_full_path(),
+    )).encode()).hexdigest()
+    return etag, last_modified
+
+
+def conditional_page(page_state, per_user=False):
+    """Отвечает 304 без рендера, если страница не менялась.
+
+    page_state получает аргументы view, а при per_user — ещё и первым
+    аргументом пользователя, и возвращает области версий страницы
+    и отметки времени её данных — результат дешёвых запросов по индексам
+    — или None, если объекта нет. Ответ помечается как личный
+    и требующий проверки при каждом обращении.
+    """
+
+    def validators(request, **kwargs):
+        if not hasattr(request, '_page_validators'):
+            args = (request.user,) if per_user else ()
+            request._page_validators = page_validators(
+                request, page_state(*args, **kwargs)
+            )
+        return request._page_validators
+
+    def etag(request, *args, **kwargs):
+        return validators(request, **kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request, **kwargs)[1]
+
+    def decorator(view):
+        return cache_control(private=True, no_cache=True)(
+            condition(etag, last_modified)(view)
+        )
+
+    return decorator
@@ -1,3 +1,40 @@
 NUMBER_OF_POSTS_ON_PAGE = 10
 MAX_GROUP_TITLE_LENGTH = 200
 POST_SYMBOLS_LIMIT = 15
+FEED_FANOUT_FOLLOWERS_LIMIT = 1000
+FEED_BATCH_SIZE = 500
+POST_CARD_CACHE_TIMEOUT = 60 * 60
+POST_CARD_INVALIDATE_BATCH = 500
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGE_CACHE_STALE_TIMEOUT = 60 * 60
+PAGE_CACHE_LOCK_TIMEOUT = 30
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_ASPECT = (960, 339)
+THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+THUMBNAIL_SIZES = '(max-width: 992px) 100vw, 960px'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+THUMBNAIL_WATCH_INTERVAL = 2
+THUMBNAIL_PENDING_TIMEOUT = 60 * 5
+THUMBNAIL_MAX_ATTEMPTS = 3
+SEARCH_SNIPPET_WORDS = 32
+SEARCH_CONFIG = 'russian'
+COMMENTS_ON_PAGE = 20
+COMMENT_ORDERINGS = {'old': 'created', 'new': '-created'}
+PAGE_COUNT_CACHE_TIMEOUT = 60 * 5
+PAGE_COUNT_STALE_TIMEOUT = 60 * 60 * 24
+PAGE_COUNT_LOCK_TIMEOUT = 60
+PAGE_WINDOW_ON_EACH_SIDE = 2
+PAGE_WINDOW_ON_ENDS = 1
+CURSOR_MAX_PAGE_NUMBER = 100
+QUERY_MAX_DEPTH = 4
+QUERY_MAX_COMPLEXITY = 2000
+QUERY_DEFAULT_FIRST = 10
+QUERY_MAX_FIRST = 50
+QUERY_MAX_ID = 2 ** 63 - 1
+LATEST_COMMENTS_DEFAULT = 3
+LATEST_COMMENTS_MAX = 20
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FILE_CHUNK_SIZE = 64 * 1024
+IMPORT_CHUNK_SIZE = 5000
+# Старые сборки SQLite принимают не больше 999 параметров запроса.
+SQL_PARAMS_BATCH = 900
@@ -0,0 +1,161 @@
+import csv
+import json
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .constants import EXPORT_CHUNK_SIZE, EXPORT_FILE_CHUNK_SIZE
+from .models import Comment, Post
+
+EXPORT_COLUMNS = ('type', 'id', 'post', 'group', 'created', 'text', 'image')
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+}
+
+
+def export_rows(author_id):
+    """Посты и комментарии пользователя по одной строке.
+
+    Строки читаются из базы пачками по EXPORT_CHUNK_SIZE без создания
+    объектов моделей, поэтому память не зависит от их числа.
+    """
+
+    posts = Post.objects.filter(author_id=author_id).order_by('id')
+    for post_id, group, created, text, image in posts.values_list(
+        'id', 'group__slug', 'created', 'text', 'image'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'post',
+            'id': post_id,
+            'group': group,
+            'created': created,
+            'text': text,
+            'image': image or None,
+        }
+    comments = Comment.objects.filter(author_id=author_id).order_by('id')
+    for comment_id, post_id, created, text in comments.values_list(
+        'id', 'post_id', 'created', 'text'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'comment',
+            'id': comment_id,
+            'post': post_id,
+            'created': created,
+            'text': text,
+        }
+
+
+def export_ndjson(author_id):
+    """Строки выгрузки в JSON, по объекту на строку."""
+
+    for row in export_rows(author_id):
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + (
+            '\n'
+        )
+
+
+class Echo:
+    """Файл, запись в который возвращает записанное без буферизации."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(author_id):
+    """Строки выгрузки в CSV с заголовком EXPORT_COLUMNS."""
+
+    writer = csv.DictWriter(Echo(), EXPORT_COLUMNS)
+    yield writer.writeheader()
+    for row in export_rows(author_id):
+        row['created'] = row['created'].isoformat()
+        yield writer.writerow(row)
+
+
+class ZipStream:
+    """Поток без перемотки для zipfile, отдающий записанное частями.
+
+    zipfile пишет в него архив последовательно, с дескрипторами данных
+    после каждого файла, а накопленные байты забираются после каждой
+    записи, так что архив целиком в памяти не держится.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self, min_size=0):
+        """Записанные байты, если их набралось не меньше min_size."""
+
+        if self.size < min_size or not self.size:
+            return b''
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def export_zip(author_id, with_images=True):
+    """Архив ZIP с выгрузкой posts.ndjson и изображениями постов."""
+
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('posts.ndjson', 'w', force_zip64=True) as entry:
+            for line in export_ndjson(author_id):
+                entry.write(line.encode())
+                yield stream.pop(EXPORT_FILE_CHUNK_SIZE)
+
+        images = Post.objects.filter(author_id=author_id).exclude(
+            image=''
+        ).order_by('image').values_list('image', flat=True).distinct()
+        for image in images.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            if not with_images or not default_storage.exists(image):
+                continue
+            info = zipfile.ZipInfo(image)
+            info.compress_type = zipfile.ZIP_STORED
+            with default_storage.open(image) as source, archive.open(
+                info, 'w', force_zip64=True
+            ) as entry:
+                for chunk in iter(
+                    lambda: source.read(EXPORT_FILE_CHUNK_SIZE), b''
+                ):
+                    entry.write(chunk)
+                    yield stream.pop(EXPORT_FILE_CHUNK_SIZE)
+    yield stream.pop()
+
+
+def buffered(chunks, size=EXPORT_FILE_CHUNK_SIZE):
+    """Склеивает мелкие части потока в части не меньше size."""
+
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield buffer[0][:0].join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+
+def export(author_id, export_format):
+    """Выгрузка пользователя в формате из EXPORTERS частями."""
+
+    return buffered(EXPORTERS[export_format](author_id))
+
+
+EXPORTERS = {
+    'ndjson': export_ndjson,
+    'csv': export_csv,
+    'zip': export_zip,
+}
@@ -0,0 +1,198 @@
+from django.db import connection
+
+from .constants import (
+    FEED_BATCH_SIZE,
+    FEED_FANOUT_FOLLOWERS_LIMIT,
+    SQL_PARAMS_BATCH,
+)
+from .models import FeedEntry, Follow, Post, UserStats
+from .utils import CursorPaginator
+
+
+def is_fanout_author(author_id):
+    """Проверяет, раскладываются ли посты автора по лентам подписчиков.
+
+    Посты авторов с очень большим числом подписчиков не копируются
+    в ленты, а подмешиваются при чтении.
+    """
+
+    return not UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=FEED_FANOUT_FOLLOWERS_LIMIT
+    ).exists()
+
+
+def fan_out_post(post):
+    """Добавляет новый пост в ленты подписчиков автора."""
+
+    if not is_fanout_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post.id, created=post.created)
+            for user_id in follower_ids
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту пользователя посты автора после подписки."""
+
+    if not is_fanout_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'id', 'created'
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, post_id=post_id, created=created)
+            for post_id, created in posts.iterator()
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fill_feeds(author_ids=None, post_ids=None):
+    """Раскладывает посты авторов по лентам их подписчиков.
+
+    author_ids и post_ids ограничивают авторов и посты, без них
+    раскладываются все. Посты авторов, у которых
+    подписчиков больше FEED_FANOUT_FOLLOWERS_LIMIT, наоборот, убираются
+    из лент: они подмешиваются при чтении. Нужна после bulk_create
+    постов и подписок, при котором сигналы не отправляются, и когда
+    автор пересекает предел; счётчики подписчиков должны быть
+    пересчитаны. Раскладка выполняется INSERT ... SELECT без загрузки
+    строк в Python; длинные списки id делятся пополам, пока в запросе
+    не больше SQL_PARAMS_BATCH параметров.
+    """
+
+    limits = {
+        name: None if ids is None else list(ids)
+        for name, ids in (('author_ids', author_ids), ('post_ids', post_ids))
+    }
+    if sum(len(ids) for ids in limits.values() if ids) > SQL_PARAMS_BATCH:
+        name = max(limits, key=lambda name: len(limits[name] or ()))
+        middle = len(limits[name]) // 2
+        for part in (limits[name][:middle], limits[name][middle:]):
+            fill_feeds(**{**limits, name: part})
+        return
+    author_ids, post_ids = limits['author_ids'], limits['post_ids']
+
+    tables = {
+        'feed': FeedEntry._meta.db_table,
+        'follow': Follow._meta.db_table,
+        'post': Post._meta.db_table,
+        'stats': UserStats._meta.db_table,
+    }
+    condition, params = 's.followers_count <= %s', [
+        FEED_FANOUT_FOLLOWERS_LIMIT
+    ]
+    popular = FeedEntry.objects.filter(
+        post__author__stats__followers_count__gt=FEED_FANOUT_FOLLOWERS_LIMIT
+    )
+    for column, lookup, ids in (
+        ('f.author_id', 'post__author_id__in', author_ids),
+        ('p.id', 'post_id__in', post_ids),
+    ):
+        if ids is None:
+            continue
+        if not ids:
+            return
+        placeholders = ', '.join(['%s'] * len(ids))
+        condition += f' AND {column} IN ({placeholders})'
+        params.extend(ids)
+        popular = popular.filter(**{lookup: ids})
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {feed} (user_id, post_id, created) '
+            'SELECT f.user_id, p.id, p.created FROM {follow} f '
+            'JOIN {post} p ON p.author_id = f.author_id '
+            'JOIN {stats} s ON s.user_id = f.author_id '
+            'WHERE {condition} '
+            'ON CONFLICT DO NOTHING'.format(condition=condition, **tables),
+            params
+        )
+    popular.delete()
+
+
+def followers_changed(author_id, delta):
+    """Перестраивает ленты, если автор пересёк предел раскладки.
+
+    Вызывается после изменения счётчика подписчиков автора на delta.
+    Ставший популярным автор убирается из лент, вернувшийся под
+    FEED_FANOUT_FOLLOWERS_LIMIT раскладывается по лентам всех
+    подписчиков: с постами и подписками, появившимися, пока его посты
+    подмешивались при чтении.
+    """
+
+    followers = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if followers is None:
+        return
+    was_fanout = followers - delta <= FEED_FANOUT_FOLLOWERS_LIMIT
+    if was_fanout != (followers <= FEED_FANOUT_FOLLOWERS_LIMIT):
+        fill_feeds([author_id])
+
+
+def prune_feed(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+
+    FeedEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id
+    ).delete()
+
+
+class FeedPaginator(CursorPaginator):
+    """Страницы ленты подписок пользователя по курсору.
+
+    Ключи постов (created, id) читаются из материализованной ленты
+    по индексу (user, created, post), а посты авторов без раскладки
+    по лентам — из их постов. Обе выборки ограничены размером страницы,
+    после слияния посты загружаются из object_list по id.
+    """
+
+    def __init__(self, object_list, per_page, ordering='-created', *, user):
+        super().__init__(object_list, per_page, ordering)
+        self.user = user
+        self.pull_author_ids = list(
+            Follow.objects.filter(
+                user=user,
+                author__stats__followers_count__gt=FEED_FANOUT_FOLLOWERS_LIMIT
+            ).values_list('author_id', flat=True)
+        )
+
+    def fetch(self, limit, offset=0, boundary=None, reverse=False):
+        sources = [(FeedEntry.objects.filter(user=self.user), 'post_id')]
+        if self.pull_author_ids:
+            sources.append(
+                (Post.objects.filter(author_id__in=self.pull_author_ids), 'id')
+            )
+        order = '' if reverse else '-'
+        keys = set()
+        for queryset, pk_field in sources:
+            if boundary:
+                queryset = queryset.filter(
+                    self.after(*boundary, pk_field=pk_field)
+                )
+            keys.update(
+                queryset.order_by(
+                    f'{order}created', f'{order}{pk_field}'
+                ).values_list('created', pk_field)[:offset + limit]
+            )
+        post_ids = [
+            post_id for _, post_id in sorted(keys, reverse=not reverse)
+        ][offset:offset + limit]
+        posts = {
+            row['id'] if isinstance(row, dict) else row.pk: row
+            for row in self.object_list.filter(pk__in=post_ids)
+        }
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
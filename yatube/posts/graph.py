@@ -0,0 +1,357 @@
+from collections import defaultdict, namedtuple
+
+from django.core.files.storage import default_storage
+from django.db.models import Count, OuterRef, Subquery
+
+from .constants import (
+    LATEST_COMMENTS_DEFAULT,
+    LATEST_COMMENTS_MAX,
+    QUERY_DEFAULT_FIRST,
+    QUERY_MAX_COMPLEXITY,
+    QUERY_MAX_DEPTH,
+    QUERY_MAX_FIRST,
+    QUERY_MAX_ID,
+)
+from .models import Comment, Group, Post, User
+from .utils import CursorPaginator
+
+# Колонки, которые читаются для объекта каждого типа. Загрузчики берут
+# их целиком, чтобы закешированная строка подходила любому выбору полей.
+USER_COLUMNS = ('id', 'username', 'first_name', 'last_name')
+GROUP_COLUMNS = ('id', 'title', 'slug', 'description')
+POST_COLUMNS = ('id', 'text', 'created', 'image', 'author_id', 'group_id')
+COMMENT_COLUMNS = ('id', 'text', 'created', 'author_id', 'post_id')
+
+Node = namedtuple('Node', 'name field args children')
+
+
+class QueryError(Exception):
+    """Запрос не соответствует схеме или превышает ограничения."""
+
+
+class DataLoader:
+    """Загружает значения по ключам пачками и кеширует их на запрос.
+
+    batch_load получает ключи без повторов и возвращает словарь
+    ключ — значение; ключам без значения соответствует default.
+    """
+
+    def __init__(self, batch_load, default=None):
+        self.batch_load = batch_load
+        self.default = default
+        self.cache = {}
+
+    def load_many(self, keys):
+        missing = {
+            key for key in keys
+            if key is not None and key not in self.cache
+        }
+        if missing:
+            loaded = self.batch_load(sorted(missing))
+            for key in missing:
+                self.cache[key] = loaded.get(key, self.default)
+        return [self.cache.get(key, self.default) for key in keys]
+
+
+def rows_by_id(model, columns):
+    def batch_load(keys):
+        rows = model.objects.filter(id__in=keys).values(*columns)
+        return {row['id']: row for row in rows}
+
+    return batch_load
+
+
+def comment_counts(post_ids):
+    return dict(
+        Comment.objects.filter(post_id__in=post_ids).order_by().values(
+            'post_id'
+        ).annotate(total=Count('id')).values_list('post_id', 'total')
+    )
+
+
+def latest_comments(first):
+    """Последние first комментариев каждого поста одним запросом."""
+
+    def batch_load(post_ids):
+        latest = Comment.objects.filter(
+            post_id=OuterRef('post_id')
+        ).order_by('-created', '-id').values('id')[:first]
+        rows = Comment.objects.filter(
+            post_id__in=post_ids,
+            id__in=Subquery(latest),
+        ).order_by('-created', '-id').values(*COMMENT_COLUMNS)
+        comments = defaultdict(list)
+        for row in rows:
+            comments[row['post_id']].append(row)
+        return comments
+
+    return batch_load
+
+
+LOADERS = {
+    'users': lambda: DataLoader(rows_by_id(User, USER_COLUMNS)),
+    'groups': lambda: DataLoader(rows_by_id(Group, GROUP_COLUMNS)),
+    'comment_counts': lambda: DataLoader(comment_counts, 0),
+    'latest_comments': lambda first: DataLoader(latest_comments(first), []),
+}
+
+
+class Context:
+    """Загрузчики одного запроса: каждый ключ читается из базы один раз."""
+
+    def __init__(self):
+        self.loaders = {}
+
+    def loader(self, name, *args):
+        key = (name, args)
+        if key not in self.loaders:
+            self.loaders[key] = LOADERS[name](*args)
+        return self.loaders[key]
+
+
+def object_selection(name, selection, allowed_args):
+    """Аргументы и вложенный выбор поля-объекта."""
+
+    if not isinstance(selection, dict) or 'fields' not in selection:
+        raise QueryError(f'Для поля {name} нужен выбор fields.')
+    args = selection.get('args') or {}
+    if not isinstance(args, dict) or set(args) - set(allowed_args):
+        raise QueryError(
+            f'Поле {name} принимает аргументы: {", ".join(allowed_args)}.'
+        )
+    return args, selection['fields']
+
+
+def int_arg(args, name, default, maximum):
+    value = args.get(name, default)
+    if isinstance(value, bool):
+        raise QueryError(f'Аргумент {name} должен быть числом.')
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise QueryError(f'Аргумент {name} должен быть числом.')
+    if not 1 <= value <= maximum:
+        raise QueryError(f'Аргумент {name} должен быть от 1 до {maximum}.')
+    return value
+
+
+class Scalar:
+    """Значение колонки строки."""
+
+    def __init__(self, column, convert=None):
+        self.column = column
+        self.convert = convert
+
+    def parse(self, name, selection, depth, multiplier):
+        if selection is not True:
+            raise QueryError(f'Поле {name} выбирается значением true.')
+        return Node(name, self, {}, []), multiplier
+
+    def resolve(self, rows, node, context):
+        values = [row[self.column] for row in rows]
+        if self.convert is None:
+            return values
+        return [self.convert(value) for value in values]
+
+
+class Related:
+    """Объект, на который строка ссылается по ключу."""
+
+    def __init__(self, type_name, key, loader):
+        self.type_name = type_name
+        self.key = key
+        self.loader = loader
+
+    def parse(self, name, selection, depth, multiplier):
+        _, fields = object_selection(name, selection, ())
+        children, cost = parse_selection(
+            self.type_name, fields, depth + 1, multiplier
+        )
+        return Node(name, self, {}, children), cost + multiplier
+
+    def resolve(self, rows, node, context):
+        objects = context.loader(self.loader).load_many(
+            [row[self.key] for row in rows]
+        )
+        resolved = iter(resolve_selection(
+            [obj for obj in objects if obj is not None],
+            node.children,
+            context,
+        ))
+        return [None if obj is None else next(resolved) for obj in objects]
+
+
+class Counted(Scalar):
+    """Число связанных объектов строки."""
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def resolve(self, rows, node, context):
+        return context.loader(self.loader).load_many(
+            [row['id'] for row in rows]
+        )
+
+
+class LatestComments:
+    """Последние комментарии поста, аргумент first — их число."""
+
+    def parse(self, name, selection, depth, multiplier):
+        args, fields = object_selection(name, selection, ('first',))
+        first = int_arg(
+            args, 'first', LATEST_COMMENTS_DEFAULT, LATEST_COMMENTS_MAX
+        )
+        children, cost = parse_selection(
+            'Comment', fields, depth + 1, multiplier * first
+        )
+        return Node(name, self, {'first': first}, children), cost + multiplier
+
+    def resolve(self, rows, node, context):
+        lists = context.loader(
+            'latest_comments', node.args['first']
+        ).load_many([row['id'] for row in rows])
+        resolved = iter(resolve_selection(
+            [comment for comments in lists for comment in comments],
+            node.children,
+            context,
+        ))
+        return [
+            [next(resolved) for _ in comments] for comments in lists
+        ]
+
+
+class PostList:
+    """Посты от новых к старым страницами по курсору after."""
+
+    allowed_args = ('first', 'after', 'group', 'author')
+
+    def parse(self, name, selection, depth, multiplier):
+        args, fields = object_selection(name, selection, self.allowed_args)
+        first = int_arg(args, 'first', QUERY_DEFAULT_FIRST, QUERY_MAX_FIRST)
+        children, cost = parse_selection(
+            'Post', fields, depth + 1, multiplier * first
+        )
+        node = Node(name, self, {**args, 'first': first}, children)
+        return node, cost + multiplier
+
+    def resolve_root(self, node, context):
+        posts = Post.objects.all()
+        if node.args.get('group'):
+            posts = posts.filter(group__slug=node.args['group'])
+        if node.args.get('author'):
+            posts = posts.filter(author__username=node.args['author'])
+        paginator = CursorPaginator(
+            posts.values(*POST_COLUMNS), node.args['first'], '-created'
+        )
+        page = paginator.get_page(cursor=node.args.get('after'))
+        return {
+            'results': resolve_selection(list(page), node.children, context),
+            'next_cursor': page.next_cursor,
+        }
+
+
+class PostById:
+    """Пост по аргументу id."""
+
+    def parse(self, name, selection, depth, multiplier):
+        args, fields = object_selection(name, selection, ('id',))
+        post_id = int_arg(args, 'id', None, QUERY_MAX_ID)
+        children, cost = parse_selection('Post', fields, depth + 1, multiplier)
+        return Node(name, self, {'id': post_id}, children), cost + multiplier
+
+    def resolve_root(self, node, context):
+        rows = list(
+            Post.objects.filter(id=node.args['id']).values(*POST_COLUMNS)
+        )
+        if not rows:
+            return None
+        return resolve_selection(rows, node.children, context)[0]
+
+
+def image_url(name):
+    return default_storage.url(name) if name else None
+
+
+TYPES = {
+    'Query': {
+        'posts': PostList(),
+        'post': PostById(),
+    },
+    'User': {
+        column: Scalar(column) for column in USER_COLUMNS
+    },
+    'Group': {
+        column: Scalar(column) for column in GROUP_COLUMNS
+    },
+    'Comment': {
+        'id': Scalar('id'),
+        'text': Scalar('text'),
+        'created': Scalar('created'),
+        'author': Related('User', 'author_id', 'users'),
+    },
+    'Post': {
+        'id': Scalar('id'),
+        'text': Scalar('text'),
+        'created': Scalar('created'),
+        'image': Scalar('image', image_url),
+        'author': Related('User', 'author_id', 'users'),
+        'group': Related('Group', 'group_id', 'groups'),
+        'comments_count': Counted('comment_counts'),
+        'latest_comments': LatestComments(),
+    },
+}
+
+
+def parse_selection(type_name, selection, depth, multiplier):
+    """Проверяет выбор полей по схеме и оценивает его сложность.
+
+    Сложность — число значений в ответе при полных страницах: поле
+    внутри списка считается столько раз, сколько в списке элементов.
+    """
+
+    if depth > QUERY_MAX_DEPTH:
+        raise QueryError(f'Вложенность запроса больше {QUERY_MAX_DEPTH}.')
+    if not isinstance(selection, dict) or not selection:
+        raise QueryError(f'Нужен непустой выбор полей {type_name}.')
+    nodes, cost = [], 0
+    for name, field_selection in selection.items():
+        field = TYPES[type_name].get(name)
+        if field is None:
+            raise QueryError(f'Неизвестное поле {type_name}.{name}.')
+        node, field_cost = field.parse(
+            name, field_selection, depth, multiplier
+        )
+        nodes.append(node)
+        cost += field_cost
+    return nodes, cost
+
+
+def resolve_selection(rows, nodes, context):
+    """Значения выбранных полей для всех строк уровня сразу.
+
+    Каждое поле-связь загружается для всего уровня одной пачкой, поэтому
+    число запросов зависит от формы запроса, а не от числа объектов.
+    """
+
+    results = [{} for _ in rows]
+    if not rows:
+        return results
+    for node in nodes:
+        values = node.field.resolve(rows, node, context)
+        for result, value in zip(results, values):
+            result[node.name] = value
+    return results
+
+
+def execute(query):
+    """Выполняет запрос: словарь корневых полей с их выбором."""
+
+    nodes, cost = parse_selection('Query', query, 0, 1)
+    if cost > QUERY_MAX_COMPLEXITY:
+        raise QueryError(
+            f'Сложность запроса {cost} больше {QUERY_MAX_COMPLEXITY}.'
+        )
+    context = Context()
+    return {
+        node.name: node.field.resolve_root(node, context) for node in nodes
+    }
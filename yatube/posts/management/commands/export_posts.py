@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import EXPORTERS, export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    """Выгружает посты и комментарии пользователя."""
+
+    help = (
+        'Выгружает посты и комментарии пользователя в NDJSON, CSV '
+        'или ZIP с изображениями, не загружая их в память целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORTERS),
+            default='ndjson',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию — стандартный вывод.',
+        )
+
+    def handle(self, *args, **options):
+        author = User.objects.filter(username=options['username']).first()
+        if author is None:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден'
+            )
+
+        chunks = export(author.id, options['format'])
+        if not options['output']:
+            if options['format'] == 'zip':
+                raise CommandError('Архив zip выгружается только в --output')
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'wb') as output:
+            for chunk in chunks:
+                output.write(
+                    chunk if isinstance(chunk, bytes) else chunk.encode()
+                )
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.write_behind import flush
+
+
+class Command(BaseCommand):
+    """Переносит в базу отложенные комментарии и подписки."""
+
+    help = (
+        'Переносит закрытые файлы очереди отложенной записи в базу, '
+        'а с --all — и файлы текущего интервала.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перенести и незакрытые файлы очереди.',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Постоянно переносить новые файлы очереди.',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            result = flush(include_open=options['all'])
+            if result:
+                self.stdout.write(self.style.SUCCESS(
+                    'Комментариев: {comments}, подписок: {follows}, '
+                    'отписок: {unfollows}'.format(**result)
+                ))
+            if not options['watch']:
+                return
+            time.sleep(settings.WRITE_BEHIND_INTERVAL)
@@ -0,0 +1,97 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from sorl.thumbnail import delete
+
+from posts.constants import THUMBNAIL_MAX_ATTEMPTS, THUMBNAIL_WATCH_INTERVAL
+from posts.models import Post, ThumbnailTask
+from posts.thumbnails import generate_thumbnail, thumbnail_done
+
+
+def init_worker():
+    django.setup()
+
+
+class Command(BaseCommand):
+    """Создаёт миниатюры изображений постов на всех ядрах процессора."""
+
+    help = (
+        'Создаёт миниатюры из очереди задач, а с --all — '
+        'для всех постов с изображениями. Задачи с ошибкой повторяются '
+        f'до {THUMBNAIL_MAX_ATTEMPTS} раз.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать все посты с изображениями.',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Удалить существующие миниатюры перед созданием.',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Постоянно обрабатывать новые задачи из очереди.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, по умолчанию — число ядер.',
+        )
+
+    def generate(self, images, workers):
+        if workers <= 1:
+            yield from map(generate_thumbnail, images)
+            return
+
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker
+        ) as executor:
+            yield from executor.map(generate_thumbnail, images, chunksize=16)
+
+    def process(self, images, workers):
+        done = failed = 0
+        for image, variants in self.generate(images, workers):
+            thumbnail_done(image, variants)
+            if variants:
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано миниатюр: {done}, с ошибками: {failed}'
+        ))
+
+    def handle(self, *args, **options):
+        if options['all']:
+            images = list(Post.objects.exclude(image='').values_list(
+                'image', flat=True
+            ).distinct())
+            if options['force']:
+                for image in images:
+                    delete(image, delete_file=False)
+            self.process(images, options['workers'])
+            return
+
+        while True:
+            images = list(
+                ThumbnailTask.objects.filter(
+                    attempts__lt=THUMBNAIL_MAX_ATTEMPTS
+                ).order_by('created').values_list('image', flat=True)
+            )
+            if images:
+                self.process(images, options['workers'])
+            if not options['watch']:
+                return
+            if not images:
+                time.sleep(THUMBNAIL_WATCH_INTERVAL)
@@ -0,0 +1,345 @@
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+
+from posts.cache import PAGE_VERSION_ALL, bump_page_version
+from posts.constants import IMPORT_CHUNK_SIZE
+from posts.feed import fill_feeds
+from posts.models import (
+    Comment,
+    Group,
+    ImportCheckpoint,
+    ImportedPost,
+    Post,
+    ThumbnailTask,
+    UserStats,
+)
+from posts.search import index_posts
+from posts.utils import batches, set_created
+
+User = get_user_model()
+
+
+class InvalidRecord(Exception):
+    """Строка выгрузки не может быть импортирована."""
+
+
+def init_worker():
+    django.setup()
+
+
+def store_image(path):
+    """Проверяет изображение и копирует его в хранилище.
+
+    Возвращает имя файла в хранилище или None, если файл не изображение.
+    """
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        with open(path, 'rb') as source:
+            return default_storage.save(
+                f'posts/{os.path.basename(path)}', File(source)
+            )
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+
+class Command(BaseCommand):
+    """Импортирует посты и комментарии из выгрузки NDJSON."""
+
+    help = (
+        'Импортирует посты, комментарии и изображения из NDJSON '
+        'в формате export_posts пачками в транзакциях. Прерванный импорт '
+        'продолжается с последней сохранённой пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Файл NDJSON.')
+        parser.add_argument(
+            '--images',
+            help='Каталог, относительно которого указаны изображения.',
+        )
+        parser.add_argument(
+            '--author',
+            help='Автор строк, в которых он не указан.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Имя места остановки, по умолчанию — полный путь source.',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=IMPORT_CHUNK_SIZE,
+            help='Строк в одной транзакции.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Строк в одном INSERT, по умолчанию — предел базы.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Процессов для изображений, по умолчанию — число ядер.',
+        )
+
+    @contextmanager
+    def image_pool(self, workers):
+        """Функция map для копирования изображений в пуле процессов."""
+
+        if workers <= 1:
+            yield map
+            return
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_worker
+        ) as executor:
+            yield executor.map
+
+    def author_id(self, record):
+        username = record.get('author') or self.default_author
+        if username not in self.users:
+            raise InvalidRecord(f'неизвестный автор {username}')
+        return self.users[username]
+
+    def created(self, record):
+        if not record.get('created'):
+            return timezone.now()
+        created = parse_datetime(record['created'])
+        if created is None:
+            raise InvalidRecord(f'неверная дата {record["created"]}')
+        if timezone.is_naive(created):
+            created = timezone.make_aware(created)
+        return created
+
+    def text(self, record):
+        text = record.get('text')
+        if not isinstance(text, str) or not text.strip():
+            raise InvalidRecord('пустой текст')
+        return text
+
+    def build_post(self, record):
+        group = record.get('group')
+        if group and group not in self.groups:
+            raise InvalidRecord(f'неизвестное сообщество {group}')
+        image = record.get('image') or ''
+        if image and self.images:
+            image = os.path.join(self.images, image)
+        if image and not os.path.isfile(image):
+            raise InvalidRecord(f'нет изображения {image}')
+        return Post(
+            text=self.text(record),
+            author_id=self.author_id(record),
+            group_id=self.groups.get(group),
+            created=self.created(record),
+            image=image,
+        )
+
+    def build_comment(self, record):
+        return Comment(
+            text=self.text(record),
+            author_id=self.author_id(record),
+            created=self.created(record),
+        )
+
+    def validate(self, lines):
+        """Разбирает строки в посты и комментарии, пропуская ошибочные.
+
+        Посты — пары (id в выгрузке, пост), комментарии — пары
+        (id поста в выгрузке, комментарий).
+        """
+
+        posts, comments = [], []
+        for number, line in lines:
+            try:
+                record = json.loads(line)
+                if record.get('type') == 'post':
+                    posts.append((record.get('id'), self.build_post(record)))
+                elif record.get('type') == 'comment':
+                    comments.append(
+                        (record.get('post'), self.build_comment(record))
+                    )
+                else:
+                    raise InvalidRecord('неизвестный тип строки')
+            except (
+                ValueError, TypeError, AttributeError, InvalidRecord
+            ) as error:
+                self.failed += 1
+                self.stderr.write(f'Строка {number}: {error}')
+        return posts, comments
+
+    def store_images(self, posts):
+        """Копирует изображения пачки в хранилище в пуле процессов.
+
+        Возвращает имена скопированных файлов.
+        """
+
+        with_images = [post for _, post in posts if post.image]
+        stored = self.map_images(
+            store_image, [post.image.name for post in with_images]
+        )
+        for post, name in zip(with_images, stored):
+            if name is None:
+                self.stderr.write(f'Не изображение: {post.image.name}')
+            post.image = name or ''
+        return [post.image.name for post in with_images if post.image]
+
+    def insert(self, model, objects):
+        """Сохраняет объекты с их датами и возвращает id в том же порядке.
+
+        Базы, не возвращающие id из bulk_create, вставляют строки
+        с возрастающими id, поэтому они берутся после прежнего максимума.
+        """
+
+        dates = [obj.created for obj in objects]
+        last_id = model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        model.objects.bulk_create(objects, self.batch_size)
+        if all(obj.pk for obj in objects):
+            ids = [obj.pk for obj in objects]
+        else:
+            ids = list(model.objects.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', flat=True))
+        if len(ids) != len(objects):
+            raise CommandError('Во время импорта в базу писали другие')
+        set_created(model, zip(ids, dates))
+        return ids
+
+    def link_comments(self, comments, checkpoint, new_ids):
+        """Комментарии с id постов в базе; к неизвестным — пропускаются."""
+
+        known_ids = dict(new_ids)
+        missing = {
+            str(source_id) for source_id, _ in comments
+        } - set(known_ids)
+        for batch in batches(missing):
+            known_ids.update(ImportedPost.objects.filter(
+                checkpoint=checkpoint, source_id__in=batch
+            ).values_list('source_id', 'post_id'))
+        linked = []
+        for source_id, comment in comments:
+            if str(source_id) in known_ids:
+                comment.post_id = known_ids[str(source_id)]
+                linked.append(comment)
+            else:
+                self.failed += 1
+                self.stderr.write(
+                    f'Комментарий к неизвестному посту {source_id}'
+                )
+        return linked
+
+    def update_related(self, posts, post_ids, comments):
+        """Обновляет счётчики, ленты и поисковый индекс для пачки.
+
+        bulk_create не отправляет сигналы, поэтому это делается здесь,
+        в транзакции пачки, и только для её постов и комментариев.
+        """
+
+        posts_counts = Counter(post.author_id for post in posts)
+        comments_counts = Counter(comment.author_id for comment in comments)
+        for author_id in posts_counts.keys() | comments_counts.keys():
+            UserStats.change(
+                author_id,
+                posts_count=posts_counts[author_id],
+                comments_count=comments_counts[author_id],
+            )
+        fill_feeds(post_ids=post_ids)
+        index_posts(post_ids)
+
+    def import_chunk(self, lines, checkpoint):
+        """Импортирует пачку строк в одной транзакции с местом остановки.
+
+        Если транзакция не зафиксирована, скопированные изображения
+        пачки удаляются.
+        """
+
+        posts, comments = self.validate(lines)
+        stored = self.store_images(posts)
+        try:
+            with transaction.atomic():
+                post_ids = self.insert(Post, [post for _, post in posts])
+                new_ids = {
+                    str(source_id): post_id
+                    for (source_id, _), post_id in zip(posts, post_ids)
+                    if source_id is not None
+                }
+                ImportedPost.objects.bulk_create(
+                    (
+                        ImportedPost(
+                            checkpoint=checkpoint,
+                            source_id=source_id,
+                            post_id=post_id,
+                        )
+                        for source_id, post_id in new_ids.items()
+                    ),
+                    self.batch_size,
+                    ignore_conflicts=True,
+                )
+                linked = self.link_comments(comments, checkpoint, new_ids)
+                self.insert(Comment, linked)
+                ThumbnailTask.objects.bulk_create(
+                    (
+                        ThumbnailTask(image=post.image.name)
+                        for _, post in posts if post.image
+                    ),
+                    ignore_conflicts=True,
+                )
+                self.update_related(
+                    [post for _, post in posts], post_ids, linked
+                )
+                checkpoint.line = lines[-1][0]
+                checkpoint.save(update_fields=['line'])
+        except BaseException:
+            for name in stored:
+                default_storage.delete(name)
+            raise
+        self.imported_posts += len(posts)
+        self.imported_comments += len(linked)
+
+    def handle(self, *args, **options):
+        self.images = options['images']
+        self.default_author = options['author']
+        self.batch_size = options['batch_size']
+        self.failed = self.imported_posts = self.imported_comments = 0
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=options['checkpoint'] or os.path.abspath(options['source'])
+        )
+
+        with self.image_pool(options['workers']) as self.map_images:
+            with open(options['source'], encoding='utf-8') as source:
+                lines = islice(enumerate(source, 1), checkpoint.line, None)
+                while True:
+                    chunk = list(islice(lines, options['chunk_size']))
+                    if not chunk:
+                        break
+                    self.import_chunk(chunk, checkpoint)
+                    self.stdout.write(f'Строк обработано: {chunk[-1][0]}')
+
+        if self.imported_posts or self.imported_comments:
+            bump_page_version(PAGE_VERSION_ALL)
+        self.stdout.write(self.style.SUCCESS(
+            f'Постов: {self.imported_posts}, '
+            f'комментариев: {self.imported_comments}, '
+            f'пропущено строк: {self.failed}'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """Заново строит поисковый индекс постов."""
+
+    help = (
+        'Заполняет поисковый индекс SQLite всеми постами, например после '
+        'bulk_create, при котором сигналы не отправляются.'
+    )
+
+    def handle(self, *args, **options):
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
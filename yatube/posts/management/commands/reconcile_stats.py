@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+
+from posts.constants import FEED_FANOUT_FOLLOWERS_LIMIT
+from posts.feed import fill_feeds
+from posts.models import UserStats
+
+COUNTERS = (
+    'posts_count',
+    'followers_count',
+    'following_count',
+    'comments_count',
+)
+
+
+def is_fanout(followers_count):
+    return followers_count <= FEED_FANOUT_FOLLOWERS_LIMIT
+
+
+class Command(BaseCommand):
+    """Пересчитывает счётчики пользователей и исправляет расхождения.
+
+    Ленты авторов, которые после пересчёта пересекли предел раскладки
+    по лентам, перестраиваются.
+    """
+
+    help = 'Пересчитывает счётчики постов, подписок и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = UserStats.counted_users().order_by('pk')
+        created = updated = 0
+        last_pk = 0
+        crossed = []
+
+        while True:
+            batch = list(
+                users.filter(pk__gt=last_pk).values('pk', *COUNTERS)[
+                    :batch_size
+                ]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]['pk']
+
+            stored = UserStats.objects.in_bulk([row['pk'] for row in batch])
+            missing, drifted = [], []
+            for row in batch:
+                user_id = row.pop('pk')
+                stats = stored.get(user_id)
+                followers = stats.followers_count if stats else 0
+                if is_fanout(followers) != is_fanout(row['followers_count']):
+                    crossed.append(user_id)
+                if stats is None:
+                    missing.append(UserStats(user_id=user_id, **row))
+                elif any(getattr(stats, f) != row[f] for f in COUNTERS):
+                    for field in COUNTERS:
+                        setattr(stats, field, row[field])
+                    drifted.append(stats)
+
+            UserStats.objects.bulk_create(missing, ignore_conflicts=True)
+            UserStats.objects.bulk_update(drifted, COUNTERS)
+            created += len(missing)
+            updated += len(drifted)
+        fill_feeds(crossed)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано записей: {created}, исправлено: {updated}'
+        ))
@@ -0,0 +1,361 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from itertools import accumulate
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageOps
+
+from posts.feed import fill_feeds
+from posts.models import Comment, Follow, Group, Post, ThumbnailTask
+from posts.utils import set_created
+
+User = get_user_model()
+
+CHUNK_SIZE = 5000
+IMAGE_SIZE = (960, 540)
+
+
+def init_worker():
+    django.setup()
+
+
+def chunk_random(seed, kind, index):
+    """Генератор, зависящий только от зерна и номера части.
+
+    Результат не меняется от числа процессов и порядка их работы.
+    """
+
+    return random.Random(f'{seed}:{kind}:{index}')
+
+
+def chunk_faker(rng):
+    fake = Faker('ru_RU')
+    fake.seed_instance(rng.getrandbits(32))
+    return fake
+
+
+def power_law(count, skew):
+    """Накопленные веса закона Ципфа для random.choices."""
+
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def build_users(task):
+    """Имена пользователей части: (номер, имя, фамилия)."""
+
+    index, start, count, options = task
+    fake = chunk_faker(chunk_random(options['seed'], 'users', index))
+    return [
+        (number, fake.first_name(), fake.last_name())
+        for number in range(start, start + count)
+    ]
+
+
+def build_image(name, rng):
+    """Сохраняет градиент случайных цветов и возвращает имя файла."""
+
+    colors = [
+        tuple(rng.randrange(256) for _ in range(3)) for _ in range(2)
+    ]
+    gradient = Image.linear_gradient('L').rotate(rng.randrange(360))
+    image = ImageOps.colorize(gradient.resize(IMAGE_SIZE), *colors)
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=80)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_posts(task):
+    """Посты части: (текст, автор, группа, минут назад, изображение).
+
+    Автор и группа — номера в списках, автора выбирают по закону Ципфа.
+    """
+
+    index, start, count, options = task
+    rng = chunk_random(options['seed'], 'posts', index)
+    fake = chunk_faker(rng)
+    weights = power_law(options['users'], options['skew'])
+    authors = rng.choices(
+        range(options['users']), cum_weights=weights, k=count
+    )
+    minutes = options['days'] * 24 * 60
+    rows = []
+    for number, author in zip(range(start, start + count), authors):
+        image = ''
+        step = options['image_step']
+        if step and number % step == 0 and number // step < options['images']:
+            image = build_image(
+                f'posts/{options["prefix"]}_{number}.jpg', rng
+            )
+        rows.append((
+            fake.paragraph(nb_sentences=rng.randint(1, 6)),
+            author,
+            rng.randrange(options['groups']) if options['groups']
+            and rng.random() < 0.5 else None,
+            rng.randrange(minutes),
+            image,
+        ))
+    return rows
+
+
+def build_follows(task):
+    """Подписки части: (подписчик, автор), авторы — по закону Ципфа."""
+
+    index, start, count, options = task
+    rng = chunk_random(options['seed'], 'follows', index)
+    weights = power_law(options['users'], options['skew'])
+    rows = set()
+    for user in range(start, start + count):
+        authors = rng.choices(
+            range(options['users']),
+            cum_weights=weights,
+            k=rng.randint(0, 2 * options['follows'])
+        )
+        rows.update((user, author) for author in authors if author != user)
+    return sorted(rows)
+
+
+def build_comments(task):
+    """Комментарии части: (текст, пост, автор, секунд назад).
+
+    Популярность постов тоже подчиняется закону Ципфа.
+    """
+
+    index, start, count, options = task
+    rng = chunk_random(options['seed'], 'comments', index)
+    fake = chunk_faker(rng)
+    weights = power_law(options['posts'], options['skew'])
+    posts = rng.choices(range(options['posts']), cum_weights=weights, k=count)
+    return [
+        (
+            fake.sentence(),
+            post,
+            rng.randrange(options['users']),
+            rng.randrange(options['days'] * 24 * 60 * 60),
+        )
+        for post in posts
+    ]
+
+
+class Command(BaseCommand):
+    """Заполняет базу большим набором данных для нагрузочных замеров."""
+
+    help = (
+        'Создаёт пользователей, группы, посты, комментарии, подписки '
+        'и изображения пачками в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=10,
+            help='Среднее число подписок пользователя.',
+        )
+        parser.add_argument(
+            '--images',
+            type=int,
+            default=0,
+            help='Сколько постов получат изображения.',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель закона Ципфа для авторов и подписок.',
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--password', default='password')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Строк в одном INSERT, по умолчанию — предел базы.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, по умолчанию — число ядер.',
+        )
+
+    def run(self, func, total):
+        """Выполняет func по частям в пуле процессов, сохраняя порядок."""
+
+        tasks = [
+            (index, start, min(CHUNK_SIZE, total - start), self.options)
+            for index, start in enumerate(range(0, total, CHUNK_SIZE))
+        ]
+        if self.workers <= 1:
+            for task in tasks:
+                yield from func(task)
+            return
+
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_worker
+        ) as executor:
+            for rows in executor.map(func, tasks):
+                yield from rows
+
+    def bulk_create(self, model, objects, dated=False):
+        """Сохраняет объекты пачками по CHUNK_SIZE.
+
+        С dated сохраняются заданные даты created: id пачки берутся
+        после прежнего максимума, в базе при заполнении никто не пишет.
+        """
+
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == CHUNK_SIZE:
+                self.insert_batch(model, batch, dated)
+                batch = []
+        self.insert_batch(model, batch, dated)
+
+    def insert_batch(self, model, batch, dated):
+        if not batch:
+            return
+        if not dated:
+            model.objects.bulk_create(
+                batch, self.batch_size, ignore_conflicts=True
+            )
+            return
+        dates = [obj.created for obj in batch]
+        last_id = model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        model.objects.bulk_create(batch, self.batch_size)
+        ids = model.objects.filter(id__gt=last_id).order_by(
+            'id'
+        ).values_list('id', flat=True)
+        set_created(model, zip(ids, dates))
+
+    def create_users(self, prefix, password):
+        password = make_password(password)
+        self.bulk_create(User, (
+            User(
+                username=f'{prefix}{number}',
+                first_name=first_name,
+                last_name=last_name,
+                password=password,
+            )
+            for number, first_name, last_name in self.run(
+                build_users, self.options['users']
+            )
+        ))
+        self.bulk_create(Group, (
+            Group(
+                title=f'Сообщество {number}',
+                slug=f'{prefix}-{number}',
+                description=f'Сообщество {number} для нагрузочных замеров',
+            )
+            for number in range(self.options['groups'])
+        ))
+        users = dict(User.objects.filter(
+            username__in=[
+                f'{prefix}{number}' for number in range(self.options['users'])
+            ]
+        ).values_list('username', 'id'))
+        groups = dict(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).values_list('slug', 'id'))
+        return (
+            [users[f'{prefix}{n}'] for n in range(self.options['users'])],
+            [groups[f'{prefix}-{n}'] for n in range(self.options['groups'])],
+        )
+
+    def create_posts(self, user_ids, group_ids):
+        now = timezone.now()
+        last_id = Post.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+        self.bulk_create(Post, (
+            Post(
+                text=text,
+                author_id=user_ids[author],
+                group_id=None if group is None else group_ids[group],
+                created=now - timedelta(minutes=minutes),
+                image=image,
+            )
+            for text, author, group, minutes, image in self.run(
+                build_posts, self.options['posts']
+            )
+        ), dated=True)
+        posts = Post.objects.filter(id__gt=last_id)
+        self.bulk_create(ThumbnailTask, (
+            ThumbnailTask(image=image)
+            for image in posts.exclude(image='').values_list(
+                'image', flat=True
+            ).iterator()
+        ))
+        return list(posts.order_by('id').values_list('id', flat=True))
+
+    def create_comments(self, user_ids, post_ids):
+        # Посты комментариев выбираются среди действительно созданных.
+        self.options['posts'] = len(post_ids)
+        if not post_ids:
+            return
+        now = timezone.now()
+        self.bulk_create(Comment, (
+            Comment(
+                text=text,
+                post_id=post_ids[post],
+                author_id=user_ids[author],
+                created=now - timedelta(seconds=seconds),
+            )
+            for text, post, author, seconds in self.run(
+                build_comments, self.options['comments']
+            )
+        ), dated=True)
+
+    def handle(self, *args, **options):
+        self.workers = options['workers']
+        self.batch_size = options['batch_size']
+        self.options = {
+            key: options[key]
+            for key in (
+                'users', 'groups', 'posts', 'comments', 'follows',
+                'images', 'skew', 'days', 'seed', 'prefix',
+            )
+        }
+        self.options['image_step'] = (
+            max(options['posts'] // options['images'], 1)
+            if options['images'] else 0
+        )
+
+        user_ids, group_ids = self.create_users(
+            options['prefix'], options['password']
+        )
+        self.stdout.write(f'Пользователей: {len(user_ids)}')
+        post_ids = self.create_posts(user_ids, group_ids)
+        self.stdout.write(f'Постов: {len(post_ids)}')
+        self.create_comments(user_ids, post_ids)
+        self.bulk_create(Follow, (
+            Follow(user_id=user_ids[user], author_id=user_ids[author])
+            for user, author in self.run(build_follows, len(user_ids))
+        ))
+
+        # bulk_create не отправляет сигналы: счётчики, ленты и поисковый
+        # индекс заполняются отдельно.
+        call_command('reconcile_stats', stdout=StringIO())
+        fill_feeds()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
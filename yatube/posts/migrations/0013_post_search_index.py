@@ -0,0 +1,41 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'posts_post_fts'
+SEARCH_CONFIG = 'russian'
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+            "text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, text) '
+            'SELECT id, text FROM posts_post'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX post_text_search_idx ON posts_post '
+            f"USING gin (to_tsvector('{SEARCH_CONFIG}', text))"
+        )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS post_text_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_imagevariant'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
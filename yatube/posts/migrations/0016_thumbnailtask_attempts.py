@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_view_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnailtask',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:10
+
+from django.db import migrations
+
+
+def queue_thumbnails(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    ThumbnailTask = apps.get_model('posts', 'ThumbnailTask')
+
+    images = Post.objects.exclude(image='').filter(
+        image_variants__isnull=True
+    ).order_by().values_list('image', flat=True).distinct()
+    ThumbnailTask.objects.bulk_create(
+        (ThumbnailTask(image=image) for image in images.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_thumbnailtask_attempts'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_thumbnails, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 
 from core.models import CreatedModel
 from .constants import MAX_GROUP_TITLE_LENGTH, POST_SYMBOLS_LIMIT
@@ -33,12 +35,14 @@ class Post(CreatedModel):
         User,
         on_delete=models.CASCADE,
         related_name='posts',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False,
     )
     group = models.ForeignKey(
         Group,
         blank=True,
         null=True,
+        db_index=False,
         on_delete=models.SET_NULL,
         related_name='posts',
         verbose_name='Сообщество',
@@ -52,9 +56,24 @@ class Post(CreatedModel):
     )
 
     class Meta:
-        """Сортирует список постов по убыванию даты."""
+        """Сортирует список постов по убыванию даты.
+
+        Составные индексы повторяют запросы лент: общей, группы и автора,
+        поэтому отдельные индексы внешних ключей не создаются.
+        """
 
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['created', 'id'], name='post_created_id_idx'),
+            models.Index(
+                fields=['author', 'created', 'id'],
+                name='post_author_created_idx'
+            ),
+            models.Index(
+                fields=['group', 'created', 'id'],
+                name='post_group_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:POST_SYMBOLS_LIMIT]
@@ -75,8 +94,17 @@ class Comment(CreatedModel):
         Post,
         on_delete=models.CASCADE,
         related_name='comments',
+        db_index=False,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     """Описывает модель Follow для хранения подписок."""
@@ -85,12 +113,194 @@ class Follow(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='follower',
+        db_index=False,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='following',
+        db_index=False,
     )
 
     class Meta:
         unique_together = ('user', 'author')
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Описывает модель FeedEntry: пост в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    created = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(
+                fields=['user', 'created', 'post'],
+                name='feed_user_created_post_idx'
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Описывает модель UserStats со счётчиками пользователя.
+
+    Счётчики поддерживаются сигналами, расхождения исправляет
+    команда reconcile_stats.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+
+    @classmethod
+    def counted(cls, user_id):
+        """Считает счётчики пользователя по данным из базы."""
+
+        counters = cls.counted_users().filter(pk=user_id).values(
+            'posts_count',
+            'followers_count',
+            'following_count',
+            'comments_count',
+        ).get()
+        return cls(user_id=user_id, **counters)
+
+    @classmethod
+    def counted_users(cls):
+        """Пользователи с посчитанными по базе счётчиками."""
+
+        def counter(model, field):
+            rows = model.objects.filter(**{field: models.OuterRef('pk')})
+            return Coalesce(models.Subquery(
+                rows.order_by().values(field).annotate(
+                    total=models.Count('pk')
+                ).values('total')
+            ), 0)
+
+        return User.objects.annotate(
+            posts_count=counter(Post, 'author'),
+            followers_count=counter(Follow, 'author'),
+            following_count=counter(Follow, 'user'),
+            comments_count=counter(Comment, 'author'),
+        )
+
+    @classmethod
+    def for_user(cls, user):
+        """Возвращает счётчики пользователя.
+
+        Запись создаётся вместе с пользователем или командой
+        reconcile_stats; если её нет, счётчики считаются по базе
+        без сохранения, чтобы чтение страницы ничего не записывало.
+        """
+
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            return cls.counted(user.id)
+
+    @classmethod
+    def change(cls, user_id, **deltas):
+        """Атомарно изменяет счётчики пользователя на заданные величины.
+
+        Если записи нет, её создаст команда reconcile_stats.
+        """
+
+        cls.objects.filter(user_id=user_id).update(**{
+            field: Greatest(models.F(field) + delta, 0)
+            for field, delta in deltas.items()
+        })
+
+
+class ThumbnailTask(models.Model):
+    """Описывает модель ThumbnailTask: очередь на создание миниатюр.
+
+    Задачи хранятся в базе, чтобы не потеряться при перезапуске воркеров;
+    необработанные выполняет команда generate_thumbnails. Задача
+    с ошибкой остаётся в очереди, attempts — число неудачных попыток.
+    """
+
+    image = models.CharField(max_length=255, unique=True)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+
+class ImageVariant(models.Model):
+    """Описывает модель ImageVariant: готовый размер изображения поста.
+
+    Размеры хранятся в базе, чтобы выводить srcset с шириной и высотой
+    картинки, не открывая файлы при рендере.
+    """
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+    )
+    name = models.CharField(max_length=255)
+    format = models.CharField(max_length=10)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['format', 'width']
+        unique_together = ('post', 'format', 'width')
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+
+class ImportCheckpoint(models.Model):
+    """Описывает модель ImportCheckpoint: место остановки импорта.
+
+    Номер строки сохраняется в транзакции пачки команды import_posts,
+    поэтому после сбоя импорт продолжается с первой незафиксированной
+    строки.
+    """
+
+    source = models.CharField(max_length=255, unique=True)
+    line = models.PositiveIntegerField(default=0)
+
+
+class ImportedPost(models.Model):
+    """Описывает модель ImportedPost: id поста в выгрузке и в базе.
+
+    По нему комментарии находят посты, импортированные в прежних пачках.
+    """
+
+    checkpoint = models.ForeignKey(
+        ImportCheckpoint,
+        on_delete=models.CASCADE,
+        related_name='posts',
+    )
+    source_id = models.CharField(max_length=255)
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+
+    class Meta:
+        unique_together = ('checkpoint', 'source_id')
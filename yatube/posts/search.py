@@ -0,0 +1,139 @@
+import re
+
+from django.db import connection
+
+from .constants import SEARCH_CONFIG, SEARCH_SNIPPET_WORDS
+from .models import Post
+from .utils import batches
+
+SEARCH_TABLE = 'posts_post_fts'
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def search_terms(query):
+    """Слова запроса без операторов полнотекстового поиска."""
+
+    return re.findall(r'\w+', query.lower())
+
+
+def index_post(post):
+    """Обновляет текст поста в индексе SQLite.
+
+    В PostgreSQL индекс построен по выражению и обновляется сам.
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post.pk]
+        )
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text]
+        )
+
+
+def index_posts(post_ids):
+    """Добавляет новые посты в индекс SQLite запросами INSERT ... SELECT.
+
+    id передаются пачками не больше SQL_PARAMS_BATCH.
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for batch in batches(post_ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE}(rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table} '
+                f'WHERE id IN ({placeholders})',
+                batch
+            )
+
+
+def unindex_post(post_id):
+    """Удаляет пост из индекса SQLite."""
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [post_id]
+        )
+
+
+def rebuild_index():
+    """Заново заполняет индекс SQLite всеми постами."""
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE}(rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}'
+        )
+
+
+def search_posts(query, queryset=None):
+    """Посты, найденные по запросу, от самых релевантных.
+
+    У каждого поста есть ``rank`` (меньше — выше в выдаче) и ``headline``
+    — фрагмент текста, где найденные слова обрамлены MARK_START/MARK_END.
+    """
+
+    posts = Post.objects.all() if queryset is None else queryset
+    terms = search_terms(query)
+    if not terms:
+        return posts.none()
+
+    post_table = Post._meta.db_table
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        posts = posts.extra(
+            tables=[SEARCH_TABLE],
+            where=[
+                f'{SEARCH_TABLE}.rowid = {post_table}.id',
+                f'{SEARCH_TABLE} MATCH %s',
+            ],
+            params=[match],
+            select={
+                'rank': f'bm25({SEARCH_TABLE})',
+                'headline': (
+                    f'snippet({SEARCH_TABLE}, 0, %s, %s, %s, %s)'
+                ),
+            },
+            select_params=[
+                MARK_START, MARK_END, '…', SEARCH_SNIPPET_WORDS
+            ],
+        )
+    elif connection.vendor == 'postgresql':
+        tsquery = f"to_tsquery('{SEARCH_CONFIG}', %s)"
+        vector = f"to_tsvector('{SEARCH_CONFIG}', {post_table}.text)"
+        match = ' & '.join(f'{term}:*' for term in terms)
+        posts = posts.extra(
+            where=[f'{vector} @@ {tsquery}'],
+            params=[match],
+            select={
+                'rank': f'-ts_rank({vector}, {tsquery})',
+                'headline': (
+                    f"ts_headline('{SEARCH_CONFIG}', {post_table}.text, "
+                    f'{tsquery}, %s)'
+                ),
+            },
+            select_params=[
+                match,
+                match,
+                f'StartSel={MARK_START}, StopSel={MARK_END}, '
+                f'MaxWords={SEARCH_SNIPPET_WORDS}, '
+                f'MinWords={SEARCH_SNIPPET_WORDS // 2}',
+            ],
+        )
+    else:
+        for term in terms:
+            posts = posts.filter(text__icontains=term)
+        posts = posts.extra(select={'rank': '0', 'headline': 'text'})
+    return posts.order_by('rank', '-created', '-id')
@@ -0,0 +1,184 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from .cache import PAGE_VERSION_ALL, bump_page_version, invalidate_post_cards
+from .feed import backfill_feed, fan_out_post, followers_changed, prune_feed
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .search import index_post, unindex_post
+
+AUTHOR_NAME_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    """Создаёт счётчики для нового пользователя."""
+
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    """Запоминает имя пользователя до сохранения."""
+
+    instance._previous_name = None
+    if instance.pk and (
+        update_fields is None or AUTHOR_NAME_FIELDS & set(update_fields)
+    ):
+        instance._previous_name = User.objects.filter(
+            pk=instance.pk
+        ).values(*AUTHOR_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def author_renamed(sender, instance, created, **kwargs):
+    """Сбрасывает карточки постов автора, если изменилось его имя."""
+
+    previous = getattr(instance, '_previous_name', None)
+    if created or not previous or all(
+        getattr(instance, field) == value
+        for field, value in previous.items()
+    ):
+        return
+    invalidate_post_cards(
+        instance.posts.values_list('id', flat=True).iterator()
+    )
+    bump_page_version(PAGE_VERSION_ALL)
+
+
+@receiver(post_save, sender=Group)
+def group_changed(sender, instance, created, **kwargs):
+    """Сбрасывает карточки постов и страницы изменённой группы."""
+
+    if not created:
+        invalidate_post_cards(
+            instance.posts.values_list('id', flat=True).iterator()
+        )
+        bump_page_version(PAGE_VERSION_ALL)
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    """Сбрасывает карточки постов и страницы удаляемой группы."""
+
+    invalidate_post_cards(
+        instance.posts.values_list('id', flat=True).iterator()
+    )
+    bump_page_version(PAGE_VERSION_ALL)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    """Запоминает группу редактируемого поста до сохранения."""
+
+    instance._previous_group_slug = None
+    if instance.pk:
+        instance._previous_group_slug = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group__slug', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    """Сбрасывает карточку поста и страницы со списками, где он выводится."""
+
+    invalidate_post_cards([instance.pk])
+    slugs = {getattr(instance, '_previous_group_slug', None)}
+    if instance.group_id:
+        slugs.add(instance.group.slug)
+    bump_page_version(
+        'index',
+        f'post:{instance.pk}',
+        f'author:{instance.author_id}',
+        *(f'group:{slug}' for slug in slugs if slug)
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    """Учитывает новый пост и раскладывает его по лентам подписчиков."""
+
+    if created:
+        UserStats.change(instance.author_id, posts_count=1)
+        fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    """Уменьшает счётчик постов автора."""
+
+    UserStats.change(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, **kwargs):
+    """Обновляет текст поста в поисковом индексе."""
+
+    index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    """Удаляет пост из поискового индекса."""
+
+    unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    """Делает устаревшей страницу поста с комментарием."""
+
+    bump_page_version(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    """Учитывает новый комментарий."""
+
+    if created:
+        UserStats.change(instance.author_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    """Уменьшает счётчик комментариев автора."""
+
+    UserStats.change(instance.author_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    """Делает устаревшими профили со счётчиками и кнопкой подписки."""
+
+    bump_page_version(
+        f'author:{instance.user_id}', f'author:{instance.author_id}'
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    """Учитывает подписку и заполняет ленту постами автора."""
+
+    if created:
+        UserStats.change(instance.user_id, following_count=1)
+        UserStats.change(instance.author_id, followers_count=1)
+        backfill_feed(instance.user_id, instance.author_id)
+        followers_changed(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    """Учитывает отписку и очищает ленту от постов автора."""
+
+    UserStats.change(instance.user_id, following_count=-1)
+    UserStats.change(instance.author_id, followers_count=-1)
+    prune_feed(instance.user_id, instance.author_id)
+    followers_changed(instance.author_id, -1)
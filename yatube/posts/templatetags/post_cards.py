@@ -0,0 +1,28 @@
+from django import template
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from posts.cache import post_card_key, post_card_variant
+from posts.constants import POST_CARD_CACHE_TIMEOUT
+
+register = template.Library()
+
+POST_CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """Выводит карточку поста, беря готовый HTML из кеша.
+
+    Кеш сбрасывается сигналами при изменении поста, его группы
+    или имени автора.
+    """
+
+    key = post_card_key(post.pk, post_card_variant(context.get('request')))
+    html = cache.get(key)
+    if html is None:
+        card = context.template.engine.get_template(POST_CARD_TEMPLATE)
+        with context.push(post=post):
+            html = card.render(context)
+        cache.set(key, html, POST_CARD_CACHE_TIMEOUT)
+    return mark_safe(html)
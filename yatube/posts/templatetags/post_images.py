@@ -0,0 +1,46 @@
+from django import template
+
+from posts.constants import THUMBNAIL_SIZES
+
+register = template.Library()
+
+FALLBACK_FORMAT = 'JPEG'
+
+
+@register.inclusion_tag('posts/includes/post_picture.html')
+def post_picture(post, alt=''):
+    """Изображение поста в нескольких размерах и форматах.
+
+    Пока размеры не созданы, выводит исходное изображение: задачу
+    ставит в очередь сохранение поста.
+    """
+
+    if not post.image:
+        return {}
+    variants = {}
+    for variant in post.image_variants.all():
+        variants.setdefault(variant.format, []).append(variant)
+    if not variants:
+        return {'original': post.image, 'alt': alt}
+
+    fallback = variants.pop(FALLBACK_FORMAT, None)
+    if fallback is None:
+        fallback = variants.popitem()[1]
+    sources = [
+        {
+            'type': f'image/{image_format.lower()}',
+            'srcset': srcset(formatted),
+        }
+        for image_format, formatted in variants.items()
+    ]
+    return {
+        'sources': sources,
+        'image': fallback[-1],
+        'srcset': srcset(fallback),
+        'sizes': THUMBNAIL_SIZES,
+        'alt': alt,
+    }
+
+
+def srcset(variants):
+    return ', '.join(f'{variant.url} {variant.width}w' for variant in variants)
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+from posts.search import MARK_END, MARK_START
+
+register = template.Library()
+
+
+@register.filter
+def highlight(headline):
+    """Выделяет найденные слова во фрагменте текста поста."""
+
+    escaped = conditional_escape(headline)
+    return mark_safe(
+        escaped.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    )
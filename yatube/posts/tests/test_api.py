@@ -0,0 +1,217 @@
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..constants import NUMBER_OF_POSTS_ON_PAGE
+from ..models import Comment, Follow, Group, Post, User
+from .constants import TEST_POSTS_COUNT
+
+
+class ApiTest(TestCase):
+    """Тестирование JSON API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader')
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for number in range(TEST_POSTS_COUNT):
+            cls.post = Post.objects.create(
+                text=f'Тестовый пост {number}',
+                author=cls.author,
+                group=cls.group,
+            )
+        Comment.objects.create(
+            text='Комментарий', author=cls.user, post=cls.post
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_lists_paginated_by_cursor(self):
+        """Списки постов отдаются страницами по курсору."""
+
+        urls = (
+            reverse('api_v1:posts'),
+            reverse('api_v1:group_posts', args=[self.group.slug]),
+            reverse('api_v1:profile', args=[self.author.username]),
+            reverse('api_v1:follow_feed'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url).json()
+                self.assertEqual(
+                    len(first['results']), NUMBER_OF_POSTS_ON_PAGE
+                )
+                self.assertEqual(first['results'][0]['id'], self.post.id)
+                second = self.client.get(
+                    url, {'cursor': first['next_cursor']}
+                ).json()
+                self.assertEqual(
+                    len(second['results']),
+                    TEST_POSTS_COUNT - NUMBER_OF_POSTS_ON_PAGE
+                )
+                self.assertIsNone(second['next_cursor'])
+
+    def test_post_detail(self):
+        """Пост отдаётся с комментариями и выбранными полями."""
+
+        response = self.client.get(
+            reverse('api_v1:post_detail', args=[self.post.id]),
+            {'fields': 'text,author'}
+        )
+        data = response.json()
+        self.assertEqual(data['post'], {
+            'text': self.post.text,
+            'author': self.author.username,
+        })
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']['results']],
+            ['Комментарий']
+        )
+
+    def test_profile_counters(self):
+        """Профиль отдаётся со счётчиками и признаком подписки."""
+
+        data = self.client.get(
+            reverse('api_v1:profile', args=[self.author.username])
+        ).json()
+        self.assertEqual(data['author']['posts_count'], TEST_POSTS_COUNT)
+        self.assertEqual(data['author']['followers_count'], 1)
+        self.assertTrue(data['following'])
+
+    def test_errors(self):
+        """Ошибки отдаются в JSON."""
+
+        response = self.client.get(
+            reverse('api_v1:post_detail', args=[self.post.id + 1])
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+
+        self.client.logout()
+        response = self.client.get(reverse('api_v1:follow_feed'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_unchanged_list_not_modified(self):
+        """Неизменённый список отдаётся ответом 304."""
+
+        url = reverse('api_v1:posts')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryApiTest(TestCase):
+    """Тестирование запросов с выбором полей."""
+
+    QUERY = {
+        'posts': {
+            'args': {'first': 10},
+            'fields': {
+                'id': True,
+                'text': True,
+                'author': {'fields': {'username': True}},
+                'group': {'fields': {'slug': True}},
+                'comments_count': True,
+                'latest_comments': {
+                    'args': {'first': 2},
+                    'fields': {
+                        'text': True,
+                        'author': {'fields': {'username': True}},
+                    },
+                },
+            },
+        },
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def create_posts(self, count, prefix='author'):
+        for number in range(count):
+            author = User.objects.create(username=f'{prefix}{number}')
+            post = Post.objects.create(
+                text=f'Пост {number}', author=author, group=self.group
+            )
+            for comment in range(3):
+                Comment.objects.create(
+                    text=f'Комментарий {comment}', author=author, post=post
+                )
+        return post
+
+    def execute(self, query):
+        return self.client.post(
+            reverse('api_v1:query'),
+            json.dumps(query),
+            content_type='application/json',
+        )
+
+    def test_query_resolves_related_objects(self):
+        """Связанные объекты и комментарии отдаются в ответе."""
+
+        post = self.create_posts(1)
+        data = self.execute(self.QUERY).json()['data']
+        self.assertEqual(data['posts']['results'], [{
+            'id': post.id,
+            'text': post.text,
+            'author': {'username': post.author.username},
+            'group': {'slug': self.group.slug},
+            'comments_count': 3,
+            'latest_comments': [
+                {'text': 'Комментарий 2', 'author': {'username': 'author0'}},
+                {'text': 'Комментарий 1', 'author': {'username': 'author0'}},
+            ],
+        }])
+
+    def test_query_count_independent_of_posts(self):
+        """Число запросов к базе не растёт с числом постов."""
+
+        self.create_posts(1)
+        with CaptureQueriesContext(connection) as one_post:
+            self.execute(self.QUERY)
+        self.create_posts(5, prefix='other')
+        with CaptureQueriesContext(connection) as many_posts:
+            self.execute(self.QUERY)
+        self.assertEqual(len(many_posts), len(one_post))
+
+    def test_invalid_queries_rejected(self):
+        """Неизвестные поля, глубокие и сложные запросы отклоняются."""
+
+        queries = (
+            {'posts': {'fields': {'password': True}}},
+            {'posts': {'args': {'first': 1000}, 'fields': {'id': True}}},
+            {'posts': {'args': {'first': True}, 'fields': {'id': True}}},
+            {'post': {'args': {'id': 10 ** 30}, 'fields': {'id': True}}},
+            {'post': {'args': {'id': 1e300}, 'fields': {'id': True}}},
+            {'posts': {'args': {'first': 50}, 'fields': {
+                'latest_comments': {'args': {'first': 20}, 'fields': {
+                    'id': True, 'text': True, 'created': True,
+                }},
+            }}},
+            'not a query',
+        )
+        for query in queries:
+            with self.subTest(query=query):
+                response = self.execute(query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('detail', response.json())
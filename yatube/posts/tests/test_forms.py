@@ -1,14 +1,17 @@
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
-from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
-from ..models import Post, User, Group, Comment
+from ..constants import THUMBNAIL_MAX_ATTEMPTS
+from ..models import Post, User, Group, Comment, ThumbnailTask
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -79,6 +82,76 @@ class PostCreateFormTests(TestCase):
             kwargs={'username': f'{self.user.username}'}
         ))
 
+    def test_create_post_enqueues_thumbnail(self):
+        """Миниатюра нового поста создаётся из очереди задач."""
+
+        uploaded = SimpleUploadedFile(
+            name='queued.gif',
+            content=self.small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertTrue(
+            ThumbnailTask.objects.filter(image=post.image.name).exists()
+        )
+        self.assertFalse(post.image_variants.exists())
+
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+
+        self.assertFalse(ThumbnailTask.objects.exists())
+        widths = post.image_variants.filter(format='JPEG').values_list(
+            'width', 'height'
+        )
+        self.assertEqual(list(widths), [(320, 113), (640, 226), (960, 339)])
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=[post.id])
+        )
+        self.assertContains(response, 'srcset=')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_failed_thumbnail_stays_queued(self):
+        """Задача с ошибкой остаётся в очереди до предела попыток."""
+
+        ThumbnailTask.objects.create(image='posts/broken.gif')
+        with mock.patch(
+            'posts.management.commands.generate_thumbnails.'
+            'generate_thumbnail',
+            side_effect=lambda image: (image, None),
+        ) as generate:
+            for _ in range(THUMBNAIL_MAX_ATTEMPTS + 1):
+                call_command(
+                    'generate_thumbnails', workers=1, stdout=StringIO()
+                )
+        self.assertEqual(generate.call_count, THUMBNAIL_MAX_ATTEMPTS)
+        self.assertEqual(
+            ThumbnailTask.objects.get().attempts, THUMBNAIL_MAX_ATTEMPTS
+        )
+
+    def test_original_image_rendered_before_thumbnails(self):
+        """До создания миниатюр выводится исходное изображение.
+
+        Рендер страницы при этом не пишет задач в очередь.
+        """
+
+        post = Post.objects.create(
+            text='Пост без миниатюр',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='rendered.gif',
+                content=self.small_gif,
+                content_type='image/gif'
+            ),
+        )
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=[post.id])
+        )
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertFalse(ThumbnailTask.objects.exists())
+
     def test_edit_post(self):
         """Проверка, что пост редактируется."""
 
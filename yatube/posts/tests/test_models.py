@@ -1,6 +1,21 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
 
-from ..models import Group, Post, User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import (
+    Comment,
+    FeedEntry,
+    Follow,
+    Group,
+    Post,
+    ThumbnailTask,
+    User,
+    UserStats,
+)
+from ..search import search_posts
 from ..constants import POST_SYMBOLS_LIMIT
 
 
@@ -63,3 +78,129 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     self.post._meta.get_field(field).help_text, expected_field)
+
+
+class UserStatsTest(TestCase):
+    """Тестирование счётчиков пользователя."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='auth')
+        cls.author = User.objects.create(username='author')
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(author=self.user, post=post, text='Текст')
+        follow = Follow.objects.create(user=self.user, author=self.author)
+
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.following_count, 1)
+        self.assertEqual(stats.comments_count, 1)
+
+        follow.delete()
+        post.delete()
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        user_stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(user_stats.comments_count, 0)
+
+    def test_missing_stats_counted_without_saving(self):
+        """Без записи счётчики считаются по базе, но не сохраняются."""
+
+        Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).delete()
+        author = User.objects.get(pk=self.author.pk)
+
+        stats = UserStats.for_user(author)
+
+        self.assertEqual(stats.posts_count, 1)
+        self.assertFalse(UserStats.objects.filter(user=author).exists())
+
+    def test_reconcile_stats_fixes_drift(self):
+        """Команда reconcile_stats исправляет разошедшиеся счётчики."""
+
+        Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).update(posts_count=10)
+        UserStats.objects.filter(user=self.user).delete()
+
+        call_command('reconcile_stats', stdout=StringIO())
+
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertTrue(UserStats.objects.filter(user=self.user).exists())
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedCommandTest(TestCase):
+    """Тестирование команды seed_yatube."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def seed(self, prefix, workers):
+        call_command(
+            'seed_yatube',
+            users=30,
+            groups=3,
+            posts=200,
+            comments=50,
+            images=2,
+            prefix=prefix,
+            workers=workers,
+            stdout=StringIO(),
+        )
+        return list(
+            Post.objects.filter(
+                author__username__startswith=prefix
+            ).order_by('id').values_list('text', 'author__username')
+        )
+
+    def test_seed_creates_consistent_data(self):
+        """Данные создаются со счётчиками, лентами и индексом поиска."""
+
+        self.seed('seed', workers=1)
+
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertEqual(ThumbnailTask.objects.count(), 2)
+        author = UserStats.objects.order_by('-posts_count').first()
+        self.assertEqual(
+            author.posts_count,
+            Post.objects.filter(author_id=author.user_id).count()
+        )
+        self.assertEqual(author.user.username, 'seed0')
+        follow = Follow.objects.filter(author=author.user).first()
+        self.assertEqual(
+            FeedEntry.objects.filter(
+                user_id=follow.user_id, post__author_id=follow.author_id
+            ).count(),
+            author.posts_count
+        )
+        word = Post.objects.first().text.split()[0]
+        self.assertTrue(search_posts(word).exists())
+
+    def test_seed_is_deterministic(self):
+        """Одно зерно даёт те же данные при любом числе процессов."""
+
+        single = self.seed('one', workers=1)
+        parallel = self.seed('two', workers=2)
+        self.assertEqual(
+            [text for text, _ in single], [text for text, _ in parallel]
+        )
+        self.assertEqual(
+            [name[3:] for _, name in single],
+            [name[3:] for _, name in parallel]
+        )
@@ -1,14 +1,54 @@
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.conf import settings as django_settings
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, router
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-
+from PIL import Image
+
+from core import db_router
+from core.query_log import assert_no_n_plus_one
+from core.query_plan import assert_query_plans
+
+from .. import write_behind
+from ..cache import (
+    PAGE_VERSION_ALL,
+    bump_page_version,
+    page_modified,
+    page_versions,
+    post_card_key,
+    versioned_cache_page,
+)
 from ..forms import PostForm
-from ..models import Post, User, Group, Comment, Follow
-from ..constants import NUMBER_OF_POSTS_ON_PAGE
+from ..search import search_posts
+from ..utils import WindowedPaginator
+from ..models import (
+    Post, User, Group, Comment, Follow, FeedEntry, ThumbnailTask, UserStats
+)
+from ..constants import (
+    COMMENTS_ON_PAGE, CURSOR_MAX_PAGE_NUMBER, NUMBER_OF_POSTS_ON_PAGE
+)
 from .constants import TEST_POSTS_COUNT
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostPagesTest(TestCase):
     """Тестирование представлений приложения posts."""
 
@@ -43,6 +83,11 @@ class PostPagesTest(TestCase):
             image=uploaded
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self):
         """Авторизация тестового пользователя и
         создание поста через форму.
@@ -160,6 +205,31 @@ class PostPagesTest(TestCase):
         self.assertEqual(comment.author, user_comment.author)
         self.assertEqual(comment.post, user_comment.post)
 
+    def test_post_detail_comments_paginated(self):
+        """Комментарии выводятся страницами, остальные отдаются в JSON."""
+
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}', author=self.user2, post=self.post)
+            for i in range(COMMENTS_ON_PAGE + 5)
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.id]),
+            {'comments': 'new'}
+        )
+        page = response.context['comments_page']
+        self.assertEqual(len(page.object_list), COMMENTS_ON_PAGE)
+        self.assertEqual(page[0].text, f'Комментарий {COMMENTS_ON_PAGE + 4}')
+
+        url = reverse('posts:post_comments', args=[self.post.id])
+        with self.assertNumQueries(2):
+            data = self.client.get(
+                url, {'order': 'new', 'cursor': page.next_cursor}
+            ).json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertEqual(data['comments'][-1]['text'], 'Комментарий 0')
+        self.assertEqual(data['comments'][0]['author'], self.user2.username)
+        self.assertIsNone(data['next_cursor'])
+
     def test_create_post_page_correct_context(self):
         """Проверка формы на странице post_create."""
 
@@ -225,11 +295,9 @@ class PostPagesTest(TestCase):
         )
 
         response = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.filter(id=test_post.id).delete()
-        response_after_delete = self.authorized_client.get(
-            reverse('posts:index')
-        )
-        self.assertEqual(response.content, response_after_delete.content)
+        Post.objects.filter(id=test_post.id).update(text='Без сигналов')
+        response_cached = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, response_cached.content)
 
         cache.clear()
 
@@ -242,6 +310,87 @@ class PostPagesTest(TestCase):
             response_after_cache_clear.content
         )
 
+    def test_index_cache_invalidated_on_post_delete(self):
+        """Удалённый пост сразу пропадает с закешированной страницы index."""
+
+        test_post = Post.objects.create(
+            text='Тестовый пост для тестирования кэша',
+            author=self.user,
+        )
+
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, test_post.text)
+        test_post.delete()
+        response_after_delete = self.authorized_client.get(
+            reverse('posts:index')
+        )
+        self.assertNotContains(response_after_delete, test_post.text)
+
+    def test_stale_index_served_while_recomputed(self):
+        """Пока страницу пересчитывает другой запрос, отдаётся старая."""
+
+        response = self.authorized_client.get(reverse('posts:index'))
+        test_post = Post.objects.create(
+            text='Тестовый пост для тестирования кэша',
+            author=self.user,
+        )
+
+        with mock.patch('posts.cache.cache.add', return_value=False):
+            response_stale = self.authorized_client.get(
+                reverse('posts:index')
+            )
+        self.assertEqual(response.content, response_stale.content)
+
+        response_fresh = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response_fresh, test_post.text)
+
+    def test_page_version_bumps_counted(self):
+        """Каждое изменение увеличивает версию области на единицу."""
+
+        version, = page_versions('bumps')
+        bump_page_version('bumps')
+        bump_page_version('bumps')
+        self.assertEqual(page_versions('bumps'), (version + 2,))
+        self.assertGreaterEqual(page_modified('bumps')[0], version)
+
+    @override_settings(REPLICA_DATABASES=['replica'])
+    def test_page_after_change_not_cached_from_replica(self):
+        """После изменения страница не кешируется с отстающей реплики."""
+
+        @db_router.replica_reads
+        @versioned_cache_page('lag')
+        def view(request):
+            # Отстающая реплика отдаёт данные до изменения.
+            return HttpResponse(router.db_for_read(Post))
+
+        def get():
+            request = RequestFactory().get('/')
+            request.user = self.user
+            token = db_router.start()
+            try:
+                return view(request).content
+            finally:
+                db_router.finish(token)
+
+        self.assertEqual(get(), b'replica')
+        bump_page_version('lag')
+        self.assertEqual(get(), b'default')
+        self.assertEqual(get(), b'default')
+
+    def test_cached_page_keeps_headers(self):
+        """Страница из кеша отдаётся с заголовками, выставленными view."""
+
+        view = mock.Mock(return_value=HttpResponse('<p>Страница</p>'))
+        view.return_value['Content-Language'] = 'ru'
+        cached_view = versioned_cache_page('headers')(view)
+        request = RequestFactory().get('/')
+        request.user = self.user
+        cached_view(request)
+        response = cached_view(request)
+        self.assertEqual(view.call_count, 1)
+        self.assertEqual(response['Content-Language'], 'ru')
+        self.assertEqual(response['Content-Type'], 'text/html; charset=utf-8')
+
     def test_user_can_follow(self):
         """Проверка, что пользователь может
         подписываться на других пользователей."""
@@ -307,6 +456,199 @@ class PostPagesTest(TestCase):
             not_follower_feed.context['page_obj'].object_list
         )
 
+    def test_unfollow_removes_posts_from_feed(self):
+        """После отписки посты автора пропадают из ленты."""
+
+        Follow.objects.create(user=self.user, author=self.user2)
+        Post.objects.create(text='Follow test post', author=self.user2)
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 1)
+
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            args=[self.user2.username]
+        ))
+
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        feed = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(feed.context['page_obj']), 0)
+
+    def test_popular_author_posts_read_on_request(self):
+        """Посты автора без раскладки по лентам всё равно видны в ленте."""
+
+        with mock.patch('posts.feed.FEED_FANOUT_FOLLOWERS_LIMIT', 0):
+            Follow.objects.create(user=self.user, author=self.user2)
+            new_post = Post.objects.create(
+                text='Follow test post',
+                author=self.user2
+            )
+            feed = self.authorized_client.get(reverse('posts:follow_index'))
+
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            list(feed.context['page_obj'].object_list),
+            [new_post]
+        )
+
+    def test_feeds_rebuilt_when_author_crosses_fanout_limit(self):
+        """Ленты перестраиваются, когда автор пересекает предел раскладки.
+
+        Посты и подписки, появившиеся, пока автор был выше предела,
+        попадают в ленты, когда он возвращается под предел.
+        """
+
+        readers = [
+            User.objects.create(username=f'reader{number}')
+            for number in range(2)
+        ]
+        with mock.patch('posts.feed.FEED_FANOUT_FOLLOWERS_LIMIT', 1):
+            Follow.objects.create(user=self.user, author=self.user2)
+            early = Post.objects.create(text='Ранний', author=self.user2)
+            Follow.objects.create(user=readers[0], author=self.user2)
+            self.assertFalse(FeedEntry.objects.exists())
+
+            late = Post.objects.create(text='Поздний', author=self.user2)
+            Follow.objects.create(user=readers[1], author=self.user2)
+            Follow.objects.filter(user=self.user).delete()
+            self.assertFalse(FeedEntry.objects.exists())
+            Follow.objects.filter(user=readers[0]).delete()
+
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user', 'post')),
+            {(readers[1].id, early.id), (readers[1].id, late.id)}
+        )
+
+    def test_feed_pages_merge_fanned_out_and_pulled_posts(self):
+        """Страницы ленты сливают материализованные и подмешанные посты."""
+
+        popular = User.objects.create(username='popular')
+        with mock.patch('posts.feed.FEED_FANOUT_FOLLOWERS_LIMIT', 1):
+            Follow.objects.create(user=self.user, author=self.user2)
+            Follow.objects.create(user=self.user, author=popular)
+            Follow.objects.create(user=self.user2, author=popular)
+            posts = [
+                Post.objects.create(text=f'Пост {number}', author=author)
+                for number in range(NUMBER_OF_POSTS_ON_PAGE)
+                for author in (self.user2, popular)
+            ]
+            pages, cursor = [], None
+            while True:
+                page = self.authorized_client.get(
+                    reverse('posts:follow_index'),
+                    {'cursor': cursor} if cursor else {}
+                ).context['page_obj']
+                pages.append(list(page))
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+
+        self.assertEqual(
+            [len(page) for page in pages], [NUMBER_OF_POSTS_ON_PAGE] * 2
+        )
+        self.assertEqual(sum(pages, []), posts[::-1])
+
+    def test_post_card_cache_invalidated(self):
+        """Карточка поста обновляется после изменения группы и поста."""
+
+        profile_url = reverse('posts:profile', args=[self.user.username])
+        self.authorized_client.get(profile_url)
+
+        group = Group.objects.get(id=self.group.id)
+        group.title = 'Новое название группы'
+        group.save()
+        response = self.authorized_client.get(profile_url)
+        self.assertContains(response, group.title)
+
+        post = Post.objects.get(id=self.post.id)
+        post.text = 'Изменённый текст поста'
+        post.save()
+        response = self.authorized_client.get(profile_url)
+        self.assertContains(response, post.text)
+
+    def test_post_cards_kept_without_rename(self):
+        """Смена пароля не сбрасывает карточки, смена имени — сбрасывает."""
+
+        profile_url = reverse('posts:profile', args=[self.user.username])
+        self.authorized_client.get(profile_url)
+        card_key = post_card_key(self.post.id, 'profile')
+        self.assertIsNotNone(cache.get(card_key))
+        version = page_versions(PAGE_VERSION_ALL)
+
+        user = User.objects.get(id=self.user.id)
+        user.set_password('new-password')
+        user.save()
+        self.assertIsNotNone(cache.get(card_key))
+        self.assertEqual(page_versions(PAGE_VERSION_ALL), version)
+
+        user.first_name = 'Новое имя'
+        user.save()
+        self.assertIsNone(cache.get(card_key))
+        self.assertNotEqual(page_versions(PAGE_VERSION_ALL), version)
+
+    def conditional_get(self, url, etag):
+        return self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменная страница отдаётся ответом 304 без рендера шаблона."""
+
+        urls = (
+            reverse('posts:post_detail', args=[self.post.id]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:group_list', args=[self.group.slug]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                # Первый ответ выдаёт CSRF-куку, от неё зависит разметка.
+                self.authorized_client.get(url)
+                response = self.authorized_client.get(url)
+                self.assertIn('Last-Modified', response)
+                response = self.conditional_get(url, response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.templates)
+
+    def test_changed_pages_modified(self):
+        """Комментарий, правка поста и подписка меняют ETag страниц."""
+
+        detail_url = reverse('posts:post_detail', args=[self.post.id])
+        profile_url = reverse('posts:profile', args=[self.user.username])
+        group_url = reverse('posts:group_list', args=[self.group.slug])
+        changes = (
+            (detail_url, lambda: Comment.objects.create(
+                text='Комментарий', author=self.user2, post=self.post
+            )),
+            (detail_url, lambda: Post.objects.get(id=self.post.id).save()),
+            (group_url, lambda: Post.objects.get(id=self.post.id).save()),
+            (profile_url, lambda: Follow.objects.create(
+                user=self.user2, author=self.user
+            )),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                self.authorized_client.get(url)
+                etag = self.authorized_client.get(url)['ETag']
+                change()
+                response = self.conditional_get(url, etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_search_uses_full_text_index(self):
+        """Поиск находит пост по началу слова и видит правки текста."""
+
+        search_url = reverse('posts:search')
+        response = self.client.get(search_url, {'q': 'тестовый номе'})
+        self.assertEqual(
+            list(response.context['page_obj'].object_list),
+            [self.post]
+        )
+        self.assertContains(response, '<mark>номер</mark>')
+
+        post = Post.objects.get(id=self.post.id)
+        post.text = 'Пост о погоде'
+        post.save()
+        response = self.client.get(search_url, {'q': 'номер'})
+        self.assertFalse(response.context['page_obj'].object_list)
+        response = self.client.get(search_url, {'q': 'погод'})
+        self.assertEqual(len(response.context['page_obj'].object_list), 1)
+
 
 class PaginatorViewTest(TestCase):
     """Тестирование паджинатора."""
@@ -332,6 +674,9 @@ class PaginatorViewTest(TestCase):
         ]
         Post.objects.bulk_create(posts)
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_correct_paginate(self):
         """Проверка, что паджинатор работает корректно."""
         pages_list = [
@@ -369,3 +714,547 @@ class PaginatorViewTest(TestCase):
                     len(page),
                     TEST_POSTS_COUNT - NUMBER_OF_POSTS_ON_PAGE
                 )
+
+    def test_page_number_past_end_and_capped(self):
+        """Номер за концом списка и огромный номер ведут на последнюю."""
+
+        for number in ('3', '10000000'):
+            with self.subTest(number=number):
+                with CaptureQueriesContext(connection) as queries:
+                    page = self.client.get(
+                        reverse('posts:index'), {'page': number}
+                    ).context['page_obj']
+                self.assertEqual(page.number, 2)
+                self.assertEqual(
+                    len(page), TEST_POSTS_COUNT - NUMBER_OF_POSTS_ON_PAGE
+                )
+                self.assertFalse(page.has_next())
+                self.assertTrue(page.has_previous())
+                offsets = [
+                    int(offset) for query in queries
+                    for offset in re.findall(r'OFFSET (\d+)', query['sql'])
+                ]
+                self.assertLessEqual(
+                    max(offsets),
+                    CURSOR_MAX_PAGE_NUMBER * NUMBER_OF_POSTS_ON_PAGE
+                )
+
+    def test_cursor_pagination(self):
+        """Проверка перехода по курсорам вперёд и назад."""
+
+        first_page = self.client.get(reverse('posts:index')).context[
+            'page_obj'
+        ]
+        second_page = self.client.get(
+            reverse('posts:index'),
+            {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(second_page.number, 2)
+        self.assertEqual(
+            len(second_page),
+            TEST_POSTS_COUNT - NUMBER_OF_POSTS_ON_PAGE
+        )
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(set(first_page).isdisjoint(second_page))
+
+        previous_page = self.client.get(
+            reverse('posts:index'),
+            {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(previous_page.number, 1)
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_invalid_cursor_returns_first_page(self):
+        """Проверка, что повреждённый курсор ведёт на первую страницу."""
+
+        response = self.client.get(
+            reverse('posts:index'),
+            {'cursor': 'not-a-cursor'}
+        )
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 1)
+        self.assertEqual(len(page), NUMBER_OF_POSTS_ON_PAGE)
+
+    def test_windowed_page_range(self):
+        """Проверка, что ссылки выводятся только на окно страниц."""
+
+        paginator = WindowedPaginator(Post.objects.all(), 1, '-created')
+        page = paginator.page(7)
+        ellipsis = paginator.ELLIPSIS
+        self.assertEqual(
+            page.page_window,
+            [1, ellipsis, 5, 6, 7, 8, 9, ellipsis, TEST_POSTS_COUNT]
+        )
+        self.assertEqual(
+            paginator.page(1).page_window,
+            [1, 2, 3, ellipsis, TEST_POSTS_COUNT]
+        )
+
+    def test_windowed_count_cached(self):
+        """Проверка, что число объектов берётся из кеша."""
+
+        posts = Post.objects.filter(group=self.group)
+        self.assertEqual(
+            WindowedPaginator(posts, 1).count, TEST_POSTS_COUNT
+        )
+        Post.objects.create(author=self.user, text='Новый', group=self.group)
+        with self.assertNumQueries(0):
+            count = WindowedPaginator(posts, 1).count
+        self.assertEqual(count, TEST_POSTS_COUNT)
+
+
+class QueryPlanViewTest(TestCase):
+    """Проверка, что запросы представлений идут по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='author')
+        cls.follower = User.objects.create(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.user,
+            group=cls.group,
+        )
+        Comment.objects.create(
+            text='Комментарий', author=cls.follower, post=cls.post
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.follower)
+
+    def test_views_use_indexes(self):
+        """Списки постов и комментариев читаются и сортируются по индексу."""
+
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+            reverse('posts:post_comments', args=[self.post.id]),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with assert_query_plans(allow_sorts=False):
+                    self.client.get(url)
+
+    def test_feed_and_search_avoid_full_scans(self):
+        """Лента и поиск не просматривают таблицы целиком."""
+
+        with assert_query_plans():
+            self.client.get(reverse('posts:follow_index'))
+        with assert_query_plans():
+            self.client.get(reverse('posts:search'), {'q': 'пост'})
+
+
+class QueryRepeatViewTest(TestCase):
+    """Проверка, что страницы не выполняют запрос на каждый объект."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.follower = User.objects.create(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        authors = [
+            User.objects.create(username=f'author{number}')
+            for number in range(5)
+        ]
+        for author in authors:
+            Follow.objects.create(user=cls.follower, author=author)
+            cls.post = Post.objects.create(
+                text='Тестовый пост',
+                author=author,
+                group=cls.group,
+            )
+        for author in authors:
+            Comment.objects.create(
+                text='Комментарий', author=author, post=cls.post
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.follower)
+
+    def test_views_without_n_plus_one(self):
+        """Авторы, группы и комментарии загружаются вместе со списком."""
+
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.post.author.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+            reverse('posts:post_comments', args=[self.post.id]),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                with assert_no_n_plus_one(threshold=3):
+                    self.client.get(url)
+
+
+class WriteBehindViewTest(TestCase):
+    """Проверка отложенной записи комментариев и подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader')
+        cls.author = User.objects.create(username='writer')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.author)
+
+    def setUp(self):
+        queue_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(queue_dir.cleanup)
+        settings = override_settings(
+            WRITE_BEHIND=True,
+            WRITE_BEHIND_DIR=queue_dir.name,
+            WRITE_BEHIND_THREAD=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.user)
+
+    def get(self, name, *args):
+        return self.client.get(reverse(f'posts:{name}', args=args))
+
+    def test_writes_saved_on_flush(self):
+        """Комментарии и подписки появляются в базе после переноса."""
+
+        self.client.post(
+            reverse('posts:add_comment', args=[self.post.id]),
+            {'text': 'Отложенный комментарий'},
+        )
+        self.get('profile_follow', self.author.username)
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+
+        result = write_behind.flush(include_open=True)
+
+        self.assertEqual(result['comments'], 1)
+        self.assertTrue(Comment.objects.filter(
+            post=self.post, author=self.user, text='Отложенный комментарий'
+        ).exists())
+        self.assertTrue(Follow.objects.filter(
+            user=self.user, author=self.author
+        ).exists())
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user, post=self.post
+        ).exists())
+        self.assertEqual(UserStats.objects.get(
+            user=self.author
+        ).followers_count, 1)
+        self.assertEqual(UserStats.objects.get(
+            user=self.user
+        ).comments_count, 1)
+        self.assertIsNone(write_behind.flush(include_open=True))
+
+    def test_last_follow_action_wins(self):
+        """Из подписок и отписок пары сохраняется последнее действие."""
+
+        Follow.objects.create(user=self.user, author=self.author)
+        self.get('profile_unfollow', self.author.username)
+        self.get('profile_follow', self.author.username)
+        self.get('profile_unfollow', self.author.username)
+        self.get('profile_follow', self.user.username)
+
+        write_behind.flush(include_open=True)
+
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(UserStats.objects.get(
+            user=self.author
+        ).followers_count, 0)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_bad_records_moved_to_dead_letter(self):
+        """Ошибочные записи не держат очередь и уходят в dead letter."""
+
+        self.client.post(
+            reverse('posts:add_comment', args=[self.post.id]),
+            {'text': 'Отложенный комментарий'},
+        )
+        self.get('profile_follow', self.author.username)
+        queue_dir = django_settings.WRITE_BEHIND_DIR
+        with open(os.path.join(
+            queue_dir, f'{0:012d}-1{write_behind.SEGMENT_SUFFIX}'
+        ), 'w', encoding='utf-8') as segment:
+            segment.write('{"op": "comment", "post": "x"}\n{"op": \n')
+
+        with mock.patch.object(
+            write_behind, 'save_follows', side_effect=IntegrityError
+        ), self.assertLogs(write_behind.logger, 'ERROR'):
+            result = write_behind.flush(include_open=True)
+
+        self.assertEqual(result['comments'], 1)
+        self.assertTrue(Comment.objects.filter(post=self.post).exists())
+        self.assertFalse(Follow.objects.exists())
+        with open(os.path.join(
+            queue_dir, write_behind.DEAD_LETTER_NAME
+        ), encoding='utf-8') as dead_letter:
+            entries = [json.loads(line)['entry'] for line in dead_letter]
+        # Запись подписки, запись с неверным полем и недописанная строка.
+        self.assertEqual(len(entries), 3)
+        self.assertIn('{"op": \n', entries)
+        self.assertIn({'op': 'comment', 'post': 'x'}, entries)
+        self.assertEqual(entries[0]['op'], 'follow')
+        self.assertIsNone(write_behind.flush(include_open=True))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportViewTest(TestCase):
+    """Проверка выгрузки постов и комментариев пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.author,
+            image=SimpleUploadedFile(
+                'export.gif', b'GIF89a', content_type='image/gif'
+            ),
+        )
+        Post.objects.create(text='Пост без картинки', author=cls.author)
+        Comment.objects.create(
+            text='Свой комментарий', author=cls.author, post=cls.post
+        )
+        Comment.objects.create(
+            text='Чужой комментарий', author=cls.reader, post=cls.post
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.author)
+        self.url = reverse('posts:profile_export', args=['author'])
+
+    def export(self, export_format):
+        response = self.client.get(self.url, {'format': export_format})
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_and_csv_export(self):
+        """Выгружаются посты и только свои комментарии."""
+
+        rows = [
+            json.loads(line)
+            for line in self.export('ndjson').decode().splitlines()
+        ]
+        self.assertEqual(
+            [(row['type'], row['text']) for row in rows],
+            [
+                ('post', 'Пост с картинкой'),
+                ('post', 'Пост без картинки'),
+                ('comment', 'Свой комментарий'),
+            ]
+        )
+        rows = list(csv.DictReader(
+            io.StringIO(self.export('csv').decode())
+        ))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['image'], self.post.image.name)
+
+    def test_zip_export_with_images(self):
+        """Архив содержит выгрузку и изображения постов."""
+
+        archive = zipfile.ZipFile(io.BytesIO(self.export('zip')))
+        self.assertEqual(
+            archive.namelist(), ['posts.ndjson', self.post.image.name]
+        )
+        self.assertEqual(archive.read(self.post.image.name), b'GIF89a')
+        self.assertEqual(
+            len(archive.read('posts.ndjson').splitlines()), 3
+        )
+
+    def test_export_only_for_owner(self):
+        """Чужую выгрузку получить нельзя."""
+
+        self.client.force_login(self.reader)
+        response = self.client.get(self.url)
+        self.assertRedirects(
+            response, reverse('posts:profile', args=['author'])
+        )
+
+    def test_export_command(self):
+        """Команда export_posts выгружает те же строки."""
+
+        out = io.StringIO()
+        call_command('export_posts', 'author', stdout=out)
+        self.assertEqual(out.getvalue().encode(), self.export('ndjson'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportCommandTest(TestCase):
+    """Проверка импорта постов командой import_posts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir, ignore_errors=True)
+        self.source = f'{self.source_dir}/posts.ndjson'
+        os.mkdir(f'{self.source_dir}/posts')
+        buffer = io.BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'GIF')
+        with open(f'{self.source_dir}/posts/import.gif', 'wb') as image:
+            image.write(buffer.getvalue())
+
+    def write(self, *records):
+        with open(self.source, 'a', encoding='utf-8') as source:
+            for record in records:
+                if not isinstance(record, str):
+                    record = json.dumps(record)
+                source.write(record + '\n')
+
+    def run_import(self, workers=1, chunk_size=2):
+        call_command(
+            'import_posts',
+            self.source,
+            images=self.source_dir,
+            author='author',
+            workers=workers,
+            chunk_size=chunk_size,
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+        )
+
+    def test_import_posts_and_comments(self):
+        """Посты, комментарии и изображения импортируются пачками."""
+
+        self.write(
+            {'type': 'post', 'id': 1, 'text': 'Первый', 'group': 'test-slug',
+             'created': '2020-01-01T10:00:00+00:00',
+             'image': 'posts/import.gif'},
+            {'type': 'post', 'id': 2, 'text': 'Второй', 'group': 'unknown'},
+            'не JSON',
+            {'type': 'comment', 'post': 1, 'text': 'Комментарий'},
+        )
+        self.run_import()
+
+        post = Post.objects.get()
+        self.assertEqual(post.text, 'Первый')
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.created.year, 2020)
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        self.assertTrue(ThumbnailTask.objects.filter(
+            image=post.image.name
+        ).exists())
+        self.assertEqual(post.comments.get().text, 'Комментарий')
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+
+    def test_import_resumes_from_checkpoint(self):
+        """Повторный запуск продолжает импорт с места остановки."""
+
+        self.write(
+            {'type': 'post', 'id': 1, 'text': 'Первый'},
+            {'type': 'post', 'id': 2, 'text': 'Второй'},
+        )
+        self.run_import()
+        self.write({'type': 'comment', 'post': 2, 'text': 'Комментарий'})
+        self.run_import()
+
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(
+            Comment.objects.get().post, Post.objects.get(text='Второй')
+        )
+
+    def test_import_with_process_pool(self):
+        """Изображения копируются в пуле процессов, ленты и поиск
+        обновляются для импортированных постов.
+        """
+
+        reader = User.objects.create(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.write(
+            {'type': 'post', 'id': 1, 'text': 'Первый импортированный',
+             'image': 'posts/import.gif'},
+            {'type': 'post', 'id': 2, 'text': 'Второй импортированный'},
+            {'type': 'post', 'id': 3, 'text': 'Третий импортированный',
+             'image': 'posts/import.gif'},
+        )
+        self.run_import(workers=2)
+
+        posts = Post.objects.order_by('id')
+        self.assertEqual(posts.count(), 3)
+        for post in posts.exclude(image=''):
+            self.assertTrue(post.image.storage.exists(post.image.name))
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('post', flat=True)),
+            set(posts.values_list('id', flat=True))
+        )
+        self.assertEqual(search_posts('импортированный').count(), 3)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3
+        )
+
+    def test_import_dates_and_long_id_lists(self):
+        """Даты постов сохраняются, а списки id в запросах делятся
+        на пачки не больше SQL_PARAMS_BATCH.
+        """
+
+        reader = User.objects.create(username='reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.write(*(
+            {'type': 'post', 'id': number, 'text': f'Пост номер {number}',
+             'created': f'2020-01-0{number}T10:00:00+00:00'}
+            for number in range(1, 8)
+        ))
+        with mock.patch('posts.utils.SQL_PARAMS_BATCH', 3), \
+                mock.patch('posts.feed.SQL_PARAMS_BATCH', 3):
+            self.run_import(chunk_size=10)
+
+        self.assertEqual(
+            [post.created.day for post in Post.objects.order_by('id')],
+            list(range(1, 8))
+        )
+        self.assertEqual(FeedEntry.objects.filter(user=reader).count(), 7)
+        self.assertEqual(search_posts('номер').count(), 7)
+        self.assertTrue(Post._meta.get_field('created').auto_now_add)
+
+    def test_failed_chunk_rolled_back_with_images(self):
+        """Незафиксированная пачка не оставляет изображений и не
+        сдвигает место остановки.
+        """
+
+        self.write({'type': 'post', 'id': 1, 'text': 'Первый',
+                    'image': 'posts/import.gif'})
+        default_storage.save('posts/existing.gif', ContentFile(b'GIF89a'))
+        images_before = set(default_storage.listdir('posts')[1])
+        with mock.patch.object(
+            ThumbnailTask.objects, 'bulk_create', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.run_import()
+
+        self.assertFalse(Post.objects.exists())
+        self.assertEqual(
+            set(default_storage.listdir('posts')[1]), images_before
+        )
+        self.run_import()
+        self.assertEqual(Post.objects.count(), 1)
@@ -0,0 +1,147 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from core.instrumentation import thumbnail_duration, timed
+
+from .cache import bump_page_version, invalidate_post_cards
+from .constants import (
+    THUMBNAIL_ASPECT,
+    THUMBNAIL_FORMATS,
+    THUMBNAIL_OPTIONS,
+    THUMBNAIL_PENDING_TIMEOUT,
+    THUMBNAIL_WIDTHS,
+)
+from .models import ImageVariant, Post, ThumbnailTask
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def variant_formats():
+    """Форматы из THUMBNAIL_FORMATS, которые умеет сохранять Pillow."""
+
+    Image.init()
+    return [name for name in THUMBNAIL_FORMATS if name in Image.SAVE]
+
+
+def generate_thumbnail(image_name):
+    """Создаёт размеры изображения во всех форматах.
+
+    Возвращает имя изображения и список размеров или None при ошибке.
+    """
+
+    aspect_width, aspect_height = THUMBNAIL_ASPECT
+    variants = []
+    try:
+        with timed('thumbnail', thumbnail_duration):
+            for image_format in variant_formats():
+                for width in THUMBNAIL_WIDTHS:
+                    height = round(width * aspect_height / aspect_width)
+                    thumbnail = get_thumbnail(
+                        image_name,
+                        f'{width}x{height}',
+                        format=image_format,
+                        **THUMBNAIL_OPTIONS
+                    )
+                    variants.append({
+                        'name': thumbnail.name,
+                        'format': image_format,
+                        'width': thumbnail.width,
+                        'height': thumbnail.height,
+                    })
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', image_name)
+        return image_name, None
+    return image_name, variants
+
+
+@transaction.atomic
+def save_variants(image_name, variants):
+    """Заменяет размеры у всех постов с этим изображением."""
+
+    post_ids = list(
+        Post.objects.filter(image=image_name).values_list('id', flat=True)
+    )
+    ImageVariant.objects.filter(post_id__in=post_ids).delete()
+    ImageVariant.objects.bulk_create(
+        ImageVariant(post_id=post_id, **variant)
+        for post_id in post_ids
+        for variant in variants
+    )
+
+
+def thumbnail_done(image_name, variants=None):
+    """Сохраняет размеры и убирает задачу из очереди.
+
+    Сбрасывает кеш карточек и страниц с постами, где есть изображение.
+    Если размеры не созданы, задача остаётся в очереди с увеличенным
+    числом попыток.
+    """
+
+    cache.delete(f'thumbnail_pending:{image_name}')
+    if not variants:
+        ThumbnailTask.objects.filter(image=image_name).update(
+            attempts=F('attempts') + 1
+        )
+        return
+    save_variants(image_name, variants)
+    ThumbnailTask.objects.filter(image=image_name).delete()
+    posts = Post.objects.filter(image=image_name).values_list(
+        'id', 'author_id', 'group__slug'
+    )
+    post_ids, scopes = set(), set()
+    for post_id, author_id, slug in posts:
+        post_ids.add(post_id)
+        scopes.update((f'post:{post_id}', f'author:{author_id}'))
+        if slug:
+            scopes.add(f'group:{slug}')
+    invalidate_post_cards(post_ids)
+    bump_page_version('index', *scopes)
+
+
+def _run(image_name):
+    try:
+        thumbnail_done(*generate_thumbnail(image_name))
+    except Exception:
+        logger.exception('Ошибка обработки миниатюры %s', image_name)
+    finally:
+        close_old_connections()
+
+
+def submit_thumbnail(image_name):
+    """Отдаёт задачу пулу потоков веб-процесса, если он включён."""
+
+    global _executor
+    if not django_settings.THUMBNAIL_WORKERS:
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=django_settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    _executor.submit(_run, image_name)
+
+
+def enqueue_thumbnail(image_name):
+    """Ставит создание миниатюры в очередь при сохранении поста.
+
+    Задача сохраняется в базе и не теряется при перезапуске; после
+    фиксации транзакции её получает пул потоков, если он включён.
+    """
+
+    if not cache.add(
+        f'thumbnail_pending:{image_name}', 1, THUMBNAIL_PENDING_TIMEOUT
+    ):
+        return
+    ThumbnailTask.objects.update_or_create(
+        image=image_name, defaults={'attempts': 0}
+    )
+    transaction.on_commit(lambda: submit_thumbnail(image_name))
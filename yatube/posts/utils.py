@@ -1,11 +1,343 @@
+import base64
+import hashlib
+import json
+import math
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.db.models import Case, Q, Value, When
+from django.utils.functional import cached_property
+
+from core.concurrency import run_in_background
+
+from .constants import (
+    COMMENTS_ON_PAGE,
+    COMMENT_ORDERINGS,
+    CURSOR_MAX_PAGE_NUMBER,
+    PAGE_COUNT_CACHE_TIMEOUT,
+    PAGE_COUNT_LOCK_TIMEOUT,
+    PAGE_COUNT_STALE_TIMEOUT,
+    PAGE_WINDOW_ON_EACH_SIDE,
+    PAGE_WINDOW_ON_ENDS,
+    SQL_PARAMS_BATCH,
+)
+
+
+class InvalidCursor(Exception):
+    """Курсор повреждён или не относится к этому списку."""
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (поле сортировки, id).
+
+    Вместо COUNT(*) и LIMIT/OFFSET делает один запрос с условием
+    по ключу последнего показанного объекта, поэтому стоимость страницы
+    не зависит от её глубины. Каждый экземпляр обслуживает одну страницу:
+    количество страниц известно только относительно текущей.
+    """
+
+    cursor_based = True
+
+    def __init__(self, object_list, per_page, ordering='-created'):
+        self.key = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        tiebreaker = '-pk' if self.descending else 'pk'
+        super().__init__(object_list.order_by(ordering, tiebreaker), per_page)
+        self._number = 1
+        self._has_next = False
+        self._rows_count = 0
+
+    @property
+    def num_pages(self):
+        """Последняя известная страница: текущая или следующая за ней."""
+
+        return self._number + int(self._has_next)
+
+    @property
+    def count(self):
+        """Нижняя граница числа объектов, без запроса к базе."""
+
+        return (self._number - 1) * self.per_page + self._rows_count + int(
+            self._has_next
+        )
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return 1
+        return max(number, 1)
+
+    def get_page(self, number=None, cursor=None):
+        """Возвращает страницу по курсору, а без него — по номеру."""
+
+        if cursor:
+            try:
+                return self.page_by_cursor(cursor)
+            except InvalidCursor:
+                pass
+        return self.page(number)
+
+    def page(self, number):
+        """Страница по номеру. Оставлена для старых ссылок вида ?page=N.
+
+        Номер не больше CURSOR_MAX_PAGE_NUMBER, чтобы OFFSET оставался
+        коротким. За концом списка, как в Paginator.get_page(), отдаётся
+        последняя страница.
+        """
+
+        number = min(self.validate_number(number), CURSOR_MAX_PAGE_NUMBER)
+        bottom = (number - 1) * self.per_page
+        rows = self.fetch(self.per_page + 1, offset=bottom)
+        if rows or number == 1:
+            return self._build_page(rows, number)
+
+        rows = self.fetch(bottom)
+        number = max(math.ceil(len(rows) / self.per_page), 1)
+        return self._build_page(
+            rows[(number - 1) * self.per_page:], number, has_next=False
+        )
+
+    def page_by_cursor(self, cursor):
+        """Страница, следующая за курсором или предшествующая ему."""
+
+        value, pk, forward, number = self.decode_cursor(cursor)
+        lookup = 'lt' if forward == self.descending else 'gt'
+        boundary = (lookup, value, pk)
+        if forward:
+            rows = self.fetch(self.per_page + 1, boundary=boundary)
+            return self._build_page(rows, number)
+
+        rows = self.fetch(self.per_page + 1, boundary=boundary, reverse=True)
+        if len(rows) <= self.per_page:
+            number = 1
+        else:
+            number = max(number, 2)
+        rows = rows[:self.per_page][::-1]
+        return self._build_page(rows, number, has_next=True)
+
+    def fetch(self, limit, offset=0, boundary=None, reverse=False):
+        """Строки списка с offset, не больше limit.
+
+        boundary — (lookup, значение ключа, pk) курсора: берутся только
+        строки за ним. При reverse порядок обратный.
+        """
+
+        queryset = self.object_list
+        if boundary:
+            queryset = queryset.filter(self.after(*boundary))
+        if reverse:
+            queryset = queryset.reverse()
+        return list(queryset[offset:offset + limit])
+
+    def after(self, lookup, value, pk, pk_field='pk'):
+        """Условие на строки за курсором по ключу и pk."""
+
+        return (
+            Q(**{f'{self.key}__{lookup}': value})
+            | Q(**{self.key: value, f'{pk_field}__{lookup}': pk})
+        )
+
+    def _build_page(self, rows, number, has_next=None):
+        if has_next is None:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        self._number = number
+        self._has_next = has_next
+        self._rows_count = len(rows)
+
+        page = self._get_page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = self.encode_cursor(rows[-1], True, number + 1)
+        if rows and number > 1:
+            page.previous_cursor = self.encode_cursor(
+                rows[0], False, number - 1
+            )
+        return page
+
+    def encode_cursor(self, obj, forward, number):
+        """Упаковывает ключ объекта в непрозрачную строку для ссылки.
 
+        Объект может быть и моделью, и строкой values() с полем id.
+        """
 
-def page_pagination(request, page_objects, count):
-    """Функция пагинатор, разбивает объекты по страницам."""
+        if isinstance(obj, dict):
+            value, pk = obj[self.key], obj['id']
+        else:
+            value, pk = getattr(obj, self.key), obj.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        raw = json.dumps([value, pk, int(forward), number])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
 
-    paginator = Paginator(page_objects, count)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    def decode_cursor(self, cursor):
+        """Распаковывает курсор в (значение ключа, pk, вперёд, номер)."""
+
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, pk, forward, number = json.loads(raw.decode())
+            field = self.object_list.model._meta.get_field(self.key)
+            value = field.to_python(value)
+            return value, int(pk), bool(forward), self.validate_number(number)
+        except (TypeError, ValueError, ValidationError) as error:
+            raise InvalidCursor(cursor) from error
+
+
+class WindowedPaginator(Paginator):
+    """Паджинатор по номерам страниц для длинных списков.
+
+    Ссылки выводятся только на окно страниц вокруг текущей и на крайние
+    страницы. Число объектов берётся из кеша: COUNT(*) выполняется,
+    только когда его там нет, а устаревшее значение отдаётся, пока
+    оно пересчитывается в фоне.
+    """
+
+    cursor_based = False
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, ordering=None):
+        if ordering:
+            tiebreaker = '-pk' if ordering.startswith('-') else 'pk'
+            object_list = object_list.order_by(ordering, tiebreaker)
+        super().__init__(object_list, per_page)
+
+    def count_key(self):
+        query = str(self.object_list.query)
+        return f'page_count:{hashlib.md5(query.encode()).hexdigest()}'
+
+    def refresh_count(self, key):
+        """Считает объекты в базе и сохраняет число в кеше."""
+
+        count = self.object_list.count()
+        cache.set(key, {
+            'count': count,
+            'fresh_until': time.time() + PAGE_COUNT_CACHE_TIMEOUT,
+        }, PAGE_COUNT_STALE_TIMEOUT)
+        cache.delete(f'{key}:lock')
+        return count
+
+    @cached_property
+    def count(self):
+        """Число объектов из кеша, при его отсутствии — из базы."""
+
+        if self.object_list.query.is_empty():
+            return 0
+        key = self.count_key()
+        entry = cache.get(key)
+        if entry is None:
+            return self.refresh_count(key)
+        stale = entry['fresh_until'] <= time.time()
+        if stale and cache.add(f'{key}:lock', 1, PAGE_COUNT_LOCK_TIMEOUT):
+            run_in_background(lambda: self.refresh_count(key))
+        return entry['count']
+
+    def get_page(self, number=None, cursor=None):
+        """Страница по номеру; курсор принимается для единообразия."""
+
+        return super().get_page(number)
+
+    def page(self, number):
+        page = super().page(number)
+        page.page_window = list(self.get_elided_page_range(page.number))
+        return page
+
+    def get_elided_page_range(
+        self,
+        number,
+        on_each_side=PAGE_WINDOW_ON_EACH_SIDE,
+        on_ends=PAGE_WINDOW_ON_ENDS,
+    ):
+        """Номера страниц окна вокруг number и крайних страниц.
+
+        Пропуски между ними обозначены ELLIPSIS.
+        """
+
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            yield from self.page_range
+            return
+        if number > on_each_side + on_ends + 2:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(self.num_pages - on_ends + 1, self.num_pages + 1)
+        else:
+            yield from range(number + 1, self.num_pages + 1)
+
+
+def page_pagination(
+    request,
+    page_objects,
+    count,
+    ordering='-created',
+    paginator_class=CursorPaginator,
+):
+    """Функция пагинатор, разбивает объекты по страницам.
+
+    По умолчанию переход между страницами идёт по курсору из параметра
+    ``cursor``; параметр ``page`` поддерживается для старых ссылок.
+    Страницы, где нужны номера и общее число объектов, передают
+    ``paginator_class=WindowedPaginator``; при ``ordering=None`` он
+    сохраняет порядок запроса.
+    """
+
+    paginator = paginator_class(page_objects, count, ordering)
+    page_obj = paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor')
+    )
 
     return page_obj
+
+
+def comment_pagination(post, order, cursor=None):
+    """Страница комментариев поста с авторами, загруженными одним запросом.
+
+    Возвращает порядок (ключ COMMENT_ORDERINGS), все комментарии поста
+    и текущую страницу.
+    """
+
+    if order not in COMMENT_ORDERINGS:
+        order = 'old'
+    comments = post.comments.select_related('author')
+    paginator = CursorPaginator(
+        comments, COMMENTS_ON_PAGE, COMMENT_ORDERINGS[order]
+    )
+    return order, comments, paginator.get_page(cursor=cursor)
+
+
+def batches(items, size=None):
+    """Список items частями не длиннее size, по умолчанию SQL_PARAMS_BATCH."""
+
+    items = list(items)
+    size = size or SQL_PARAMS_BATCH
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def set_created(model, dates):
+    """Записывает даты создания после bulk_create.
+
+    bulk_create подставляет в поле created с auto_now_add текущее время,
+    поэтому даты из пар (pk, дата) записываются отдельным UPDATE.
+    """
+
+    field = model._meta.get_field('created')
+    # На строку приходится по параметру в IN и два в WHEN.
+    for batch in batches(dates, SQL_PARAMS_BATCH // 3):
+        model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            created=Case(
+                *(
+                    When(pk=pk, then=Value(created, output_field=field))
+                    for pk, created in batch
+                ),
+                output_field=field,
+            )
+        )
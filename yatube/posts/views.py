@@ -1,19 +1,42 @@
+from functools import partial
+
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect, reverse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-
-from .utils import page_pagination
-from .models import Post, Group, User, Follow
+from django.utils.dateformat import format as format_date
+from django.utils.http import urlencode
+from django.utils.timezone import localtime
+
+from core.concurrency import run_concurrently
+from core.db_router import replica_reads
+
+from .cache import versioned_cache_page
+from .conditional import (
+    conditional_page,
+    group_page_state,
+    post_page_state,
+    profile_page_state,
+)
+from .feed import FeedPaginator
+from .search import search_posts
+from . import write_behind
+from .export import CONTENT_TYPES, export
+from .thumbnails import enqueue_thumbnail
+from .utils import comment_pagination, page_pagination, WindowedPaginator
+from .models import Post, Group, User, Follow, UserStats
 from .constants import NUMBER_OF_POSTS_ON_PAGE
 from .forms import PostForm, CommentForm
 
 
-@cache_page(20, key_prefix='index_page')
+@replica_reads
+@versioned_cache_page('index')
 def index(request):
     """Рендер главной страницы со списком всех постов."""
 
     template = 'posts/index.html'
-    posts = Post.objects.select_related('author', 'group')
+    posts = Post.objects.select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants')
     page_obj = page_pagination(request, posts, NUMBER_OF_POSTS_ON_PAGE)
 
     context = {
@@ -23,12 +46,17 @@ def index(request):
     return render(request, template, context)
 
 
+@replica_reads
+@conditional_page(group_page_state)
+@versioned_cache_page('group:{slug}')
 def group_posts(request, slug):
     """Рендер страницы со списком постов сообщества."""
 
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
+    posts = group.posts.select_related(
+        'author'
+    ).prefetch_related('image_variants')
     page_obj = page_pagination(request, posts, NUMBER_OF_POSTS_ON_PAGE)
 
     context = {
@@ -39,21 +67,55 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+def search(request):
+    """Рендер страницы поиска по тексту постов."""
+
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query).select_related('author', 'group')
+    page_obj = page_pagination(
+        request,
+        posts,
+        NUMBER_OF_POSTS_ON_PAGE,
+        ordering=None,
+        paginator_class=WindowedPaginator,
+    )
+
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&' if query else '',
+    }
+
+    return render(request, 'posts/search.html', context)
+
+
+@replica_reads
+@conditional_page(profile_page_state)
 def profile(request, username):
     """Рендер страницы профиля пользователя."""
 
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('group')
-    page_obj = page_pagination(request, posts, NUMBER_OF_POSTS_ON_PAGE)
-
-    following = False
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username
+    )
+    posts = author.posts.select_related(
+        'group'
+    ).prefetch_related('image_variants')
+    following = Follow.objects.none()
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user,
-            author=author).exists()
+            author=author)
+
+    # Страница постов и проверка подписки не зависят друг от друга.
+    page_obj, following = run_concurrently(
+        lambda: page_pagination(request, posts, NUMBER_OF_POSTS_ON_PAGE),
+        following.exists,
+    )
 
     context = {
         'author': author,
+        'stats': UserStats.for_user(author),
         'page_obj': page_obj,
         'following': following,
     }
@@ -61,21 +123,67 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@replica_reads
+@conditional_page(post_page_state)
 def post_detail(request, post_id):
     """Рендер страницы с информацией о посте."""
 
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related(
+            'author__stats', 'group'
+        ).prefetch_related('image_variants'),
+        id=post_id
+    )
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    order, comments, comments_page = comment_pagination(
+        post,
+        request.GET.get('comments'),
+        request.GET.get('comments_cursor')
+    )
     context = {
         'post': post,
+        'stats': UserStats.for_user(post.author),
         'form': form,
         'comments': comments,
+        'comments_page': comments_page,
+        'comments_order': order,
     }
 
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев поста в JSON для «Показать ещё»."""
+
+    post = get_object_or_404(Post, id=post_id)
+    order, _, page = comment_pagination(
+        post,
+        request.GET.get('order'),
+        request.GET.get('cursor')
+    )
+    comments = [
+        {
+            'id': comment.id,
+            'text': comment.text,
+            'created': comment.created.isoformat(),
+            'created_display': format_date(
+                localtime(comment.created), 'd E Y'
+            ),
+            'author': comment.author.username,
+            'author_url': reverse(
+                'posts:profile', args=[comment.author.username]
+            ),
+        }
+        for comment in page
+    ]
+
+    return JsonResponse({
+        'order': order,
+        'comments': comments,
+        'next_cursor': page.next_cursor,
+    })
+
+
 @login_required()
 def create_post(request):
     """Рендер страницы с формой для создания нового поста."""
@@ -89,6 +197,8 @@ def create_post(request):
         post = form.save(commit=False)
         post.author_id = request.user.id
         post.save()
+        if post.image:
+            enqueue_thumbnail(post.image.name)
         return redirect(reverse('posts:profile', args=[request.user.username]))
 
     is_edit = False
@@ -116,7 +226,11 @@ def post_edit(request, post_id):
         files=request.FILES or None)
 
     if form.is_valid():
-        form.save()
+        if 'image' in form.changed_data:
+            post.image_variants.all().delete()
+        post = form.save()
+        if post.image and 'image' in form.changed_data:
+            enqueue_thumbnail(post.image.name)
         return redirect(post_detail_url)
 
     is_edit = True
@@ -136,7 +250,11 @@ def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
 
-    if form.is_valid():
+    if form.is_valid() and write_behind.enabled():
+        write_behind.queue_comment(
+            post.id, request.user.id, form.cleaned_data['text']
+        )
+    elif form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
@@ -146,13 +264,19 @@ def add_comment(request, post_id):
 
 
 @login_required
+@replica_reads
 def follow_index(request):
     """Рендер страницы с постами избранных авторов."""
 
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('author')
-    page_obj = page_pagination(request, posts, NUMBER_OF_POSTS_ON_PAGE)
+    posts = Post.objects.select_related(
+        'author', 'group'
+    ).prefetch_related('image_variants')
+    page_obj = page_pagination(
+        request,
+        posts,
+        NUMBER_OF_POSTS_ON_PAGE,
+        paginator_class=partial(FeedPaginator, user=request.user),
+    )
     context = {'page_obj': page_obj}
 
     return render(request, 'posts/follow.html', context)
@@ -163,14 +287,10 @@ def profile_follow(request, username):
     """Оформление подписки на автора."""
 
     author = get_object_or_404(User, username=username)
-    following = Follow.objects.filter(
-        user=request.user,
-        author=author).exists()
-    if not (following or author == request.user):
-        Follow(
-            user=request.user,
-            author=get_object_or_404(User, username=username)
-        ).save()
+    if author != request.user and write_behind.enabled():
+        write_behind.queue_follow(request.user.id, author.id)
+    elif author != request.user:
+        Follow.objects.get_or_create(user=request.user, author=author)
 
     return redirect('posts:profile', username=username)
 
@@ -180,6 +300,35 @@ def profile_unfollow(request, username):
     """Отписка от автора."""
 
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    if write_behind.enabled():
+        write_behind.queue_unfollow(request.user.id, author.id)
+    else:
+        Follow.objects.filter(user=request.user, author=author).delete()
 
     return redirect('posts:profile', username=username)
+
+
+@login_required
+def profile_export(request, username):
+    """Выгрузка постов и комментариев пользователя потоком.
+
+    Формат — параметр ``format``: ndjson, csv или zip с изображениями.
+    Выгрузку получает сам пользователь или сотрудник.
+    """
+
+    author = get_object_or_404(User, username=username)
+    if author != request.user and not request.user.is_staff:
+        return redirect('posts:profile', username=username)
+
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in CONTENT_TYPES:
+        export_format = 'ndjson'
+    response = StreamingHttpResponse(
+        export(author.id, export_format),
+        content_type=CONTENT_TYPES[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{export_format}"'
+    )
+
+    return response
@@ -0,0 +1,378 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import (
+    InterfaceError,
+    OperationalError,
+    close_old_connections,
+    transaction,
+)
+from django.db.models import Q
+
+from .cache import bump_page_version
+from .feed import backfill_feed, followers_changed
+from .models import Comment, Follow, Post, User, UserStats
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+CLAIMED_SUFFIX = '.claimed'
+DEAD_LETTER_NAME = 'dead_letter.ndjson'
+
+# Поля записей каждого вида и их типы.
+RECORD_FIELDS = {
+    'comment': {'post': int, 'author': int, 'text': str},
+    'follow': {'user': int, 'author': int},
+    'unfollow': {'user': int, 'author': int},
+}
+# Ошибки соединения с базой: записи не виноваты и переносятся позже.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def enabled():
+    return settings.WRITE_BEHIND
+
+
+def current_bucket():
+    return int(time.time() // settings.WRITE_BEHIND_INTERVAL)
+
+
+def append_lines(path, lines):
+    """Дописывает строки в файл и дожидается их записи на диск."""
+
+    with open(path, 'a', encoding='utf-8') as segment:
+        segment.writelines(line + '\n' for line in lines)
+        segment.flush()
+        os.fsync(segment.fileno())
+
+
+def enqueue(operation, **fields):
+    """Дописывает запись в сегмент очереди текущего интервала.
+
+    Сегмент свой у каждого процесса, запись одной строкой в режиме
+    дозаписи не перемешивается с записями других потоков. Запрос
+    завершается после записи строки на диск.
+    """
+
+    os.makedirs(settings.WRITE_BEHIND_DIR, exist_ok=True)
+    path = os.path.join(
+        settings.WRITE_BEHIND_DIR,
+        f'{current_bucket():012d}-{os.getpid()}{SEGMENT_SUFFIX}'
+    )
+    append_lines(
+        path, [json.dumps({'op': operation, 'ts': time.time(), **fields})]
+    )
+    start_flusher()
+
+
+def queue_comment(post_id, author_id, text):
+    enqueue('comment', post=post_id, author=author_id, text=text)
+
+
+def queue_follow(user_id, author_id):
+    enqueue('follow', user=user_id, author=author_id)
+
+
+def queue_unfollow(user_id, author_id):
+    enqueue('unfollow', user=user_id, author=author_id)
+
+
+def claim_segments(include_open=False):
+    """Забирает закрытые сегменты, переименовывая их.
+
+    Сегмент закрыт, когда его интервал и следующий за ним прошли:
+    запись, начатая в конце интервала, успевает завершиться.
+    Переименование атомарно, поэтому сегмент получает один процесс.
+    """
+
+    last_closed = current_bucket() - 2
+    claimed = []
+    pattern = os.path.join(settings.WRITE_BEHIND_DIR, f'*{SEGMENT_SUFFIX}')
+    for path in sorted(glob.glob(pattern)):
+        bucket = int(os.path.basename(path).split('-', 1)[0])
+        if bucket > last_closed and not include_open:
+            continue
+        try:
+            os.rename(path, path + CLAIMED_SUFFIX)
+        except FileNotFoundError:
+            continue
+        claimed.append(path + CLAIMED_SUFFIX)
+    return claimed
+
+
+def release_segments(paths):
+    """Возвращает забранные сегменты в очередь."""
+
+    for path in paths:
+        os.rename(path, path[:-len(CLAIMED_SUFFIX)])
+
+
+def requeue(records):
+    """Ставит записи обратно в очередь отдельным сегментом.
+
+    Сегмент пишется под временным именем и переименовывается, поэтому
+    его не заберут недописанным. Нулевой интервал делает его закрытым.
+    """
+
+    if not records:
+        return
+    path = os.path.join(
+        settings.WRITE_BEHIND_DIR,
+        f'{0:012d}-{os.getpid()}-{uuid.uuid4().hex}{SEGMENT_SUFFIX}'
+    )
+    append_lines(path + '.tmp', [json.dumps(record) for record in records])
+    os.rename(path + '.tmp', path)
+
+
+def dead_letter(entries):
+    """Дописывает в DEAD_LETTER_NAME записи, которые не переносятся.
+
+    entries — пары (запись или строка сегмента, причина).
+    """
+
+    if not entries:
+        return
+    for entry, reason in entries:
+        logger.error('Запись очереди отложена в %s: %s, %r',
+                     DEAD_LETTER_NAME, reason, entry)
+    append_lines(
+        os.path.join(settings.WRITE_BEHIND_DIR, DEAD_LETTER_NAME),
+        [
+            json.dumps({'entry': entry, 'reason': reason})
+            for entry, reason in entries
+        ]
+    )
+
+
+def valid_record(record):
+    """Запись известного вида со всеми полями нужных типов."""
+
+    fields = isinstance(record, dict) and RECORD_FIELDS.get(record.get('op'))
+    if not fields or type(record.get('ts')) not in (int, float):
+        return False
+    return all(
+        type(record.get(name)) is field_type
+        for name, field_type in fields.items()
+    )
+
+
+def read_records(paths):
+    """Записи сегментов по времени и отклонённые строки с причинами.
+
+    Недописанные, повреждённые и неизвестные строки не переносятся.
+    """
+
+    records, rejected = [], []
+    for path in paths:
+        with open(path, encoding='utf-8') as segment:
+            for line in segment:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    rejected.append((line, 'повреждённая строка'))
+                    continue
+                if valid_record(record):
+                    records.append(record)
+                else:
+                    rejected.append((record, 'неверная запись'))
+    records.sort(key=lambda record: record['ts'])
+    return records, rejected
+
+
+def save_comments(records):
+    """Сохраняет комментарии одним INSERT и учитывает их в счётчиках.
+
+    Комментарии к удалённым за это время постам и от удалённых
+    пользователей пропускаются.
+    """
+
+    post_ids = set(Post.objects.filter(
+        id__in={record['post'] for record in records}
+    ).values_list('id', flat=True))
+    user_ids = set(User.objects.filter(
+        id__in={record['author'] for record in records}
+    ).values_list('id', flat=True))
+    comments = [
+        Comment(
+            post_id=record['post'],
+            author_id=record['author'],
+            text=record['text'],
+        )
+        for record in records
+        if record['post'] in post_ids and record['author'] in user_ids
+    ]
+    Comment.objects.bulk_create(comments)
+    for author_id, count in Counter(
+        comment.author_id for comment in comments
+    ).items():
+        UserStats.change(author_id, comments_count=count)
+    return {f'post:{comment.post_id}' for comment in comments}
+
+
+def existing_follows(pairs):
+    if not pairs:
+        return set()
+    return set(Follow.objects.filter(
+        user_id__in={user_id for user_id, _ in pairs},
+        author_id__in={author_id for _, author_id in pairs},
+    ).values_list('user_id', 'author_id')) & pairs
+
+
+def save_follows(follows, unfollows):
+    """Применяет итог подписок и отписок пары пользователей.
+
+    Новые подписки сохраняются одним INSERT с ignore_conflicts на
+    уникальности пары, их счётчики и ленты обновляются здесь.
+    Отписки удаляются одним DELETE, остальное делают его сигналы.
+    """
+
+    existing = existing_follows(follows | unfollows)
+    user_ids = set(User.objects.filter(
+        id__in={user_id for pair in follows for user_id in pair}
+    ).values_list('id', flat=True))
+    new = sorted(
+        (user_id, author_id) for user_id, author_id in follows - existing
+        if user_id != author_id and {user_id, author_id} <= user_ids
+    )
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in new),
+        ignore_conflicts=True,
+    )
+    for user_id, count in Counter(user_id for user_id, _ in new).items():
+        UserStats.change(user_id, following_count=count)
+    followers = Counter(author_id for _, author_id in new)
+    for author_id, count in followers.items():
+        UserStats.change(author_id, followers_count=count)
+    for user_id, author_id in new:
+        backfill_feed(user_id, author_id)
+    for author_id, count in followers.items():
+        followers_changed(author_id, count)
+
+    gone = unfollows & existing
+    if gone:
+        Follow.objects.filter(reduce(or_, (
+            Q(user_id=user_id, author_id=author_id)
+            for user_id, author_id in gone
+        ))).delete()
+    return {f'author:{user_id}' for pair in new for user_id in pair}
+
+
+def apply_records(records):
+    """Переносит записи очереди в базу одной транзакцией.
+
+    Для пары подписчик-автор остаётся последнее действие. Возвращает
+    число записей каждого вида и области страниц, которые устарели.
+    """
+
+    actions = {}
+    for record in records:
+        if record['op'] in ('follow', 'unfollow'):
+            actions[(record['user'], record['author'])] = record['op']
+    follows = {pair for pair, op in actions.items() if op == 'follow'}
+    unfollows = set(actions) - follows
+    comments = [record for record in records if record['op'] == 'comment']
+
+    scopes = set()
+    with transaction.atomic():
+        if comments:
+            scopes |= save_comments(comments)
+        if follows or unfollows:
+            scopes |= save_follows(follows, unfollows)
+    return Counter({
+        'comments': len(comments),
+        'follows': len(follows),
+        'unfollows': len(unfollows),
+    }), scopes
+
+
+def apply_each(records):
+    """Переносит записи по одной, непереносимые — в DEAD_LETTER_NAME.
+
+    При ошибке соединения с базой останавливается и возвращает вместе
+    с итогом записи, которые ещё не перенесены.
+    """
+
+    result, scopes = Counter(), set()
+    for number, record in enumerate(records):
+        try:
+            counts, record_scopes = apply_records([record])
+        except TRANSIENT_ERRORS:
+            logger.exception('Перенос отложенной записи прерван')
+            return result, scopes, records[number:]
+        except Exception as error:
+            dead_letter([(record, repr(error))])
+            continue
+        result.update(counts)
+        scopes |= record_scopes
+    return result, scopes, []
+
+
+def flush(include_open=False):
+    """Переносит в базу закрытые сегменты очереди.
+
+    Записи переносятся одной транзакцией, а если она не удалась —
+    по одной, чтобы ошибочная запись не держала очередь; такие записи
+    уходят в DEAD_LETTER_NAME. При ошибке соединения с базой записи
+    возвращаются в очередь и будут перенесены при следующем вызове.
+    """
+
+    paths = claim_segments(include_open)
+    if not paths:
+        return None
+    records, rejected = read_records(paths)
+    remaining = []
+    try:
+        result, scopes = apply_records(records)
+    except TRANSIENT_ERRORS:
+        release_segments(paths)
+        raise
+    except Exception:
+        logger.exception('Пачка отложенной записи переносится по одной')
+        result, scopes, remaining = apply_each(records)
+    requeue(remaining)
+    dead_letter(rejected)
+    for path in paths:
+        os.remove(path)
+    if scopes:
+        bump_page_version(*scopes)
+    return {
+        name: result[name] for name in ('comments', 'follows', 'unfollows')
+    }
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.WRITE_BEHIND_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logger.exception('Ошибка переноса отложенной записи')
+        finally:
+            close_old_connections()
+
+
+def start_flusher():
+    """Запускает поток переноса в процессе веб-сервера, если он включён."""
+
+    global _flusher
+    if not settings.WRITE_BEHIND_THREAD or _flusher is not None:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(
+                target=_flush_loop, name='write-behind', daemon=True
+            )
+            _flusher.start()
@@ -18,12 +18,60 @@ ALLOWED_HOSTS = [
     'qwerttty.pythonanywhere.com'
 ]
 
+# Кеш выбирается переменной окружения CACHE_BACKEND:
+# locmem — память процесса, file — файлы, общие для воркеров на сервере,
+# redis — сервер с протоколом Redis, адрес задаётся в CACHE_LOCATION.
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'core.cache.backends.MeteredLocMemCache',
+    },
+    'file': {
+        'BACKEND': 'core.cache.backends.MeteredFileBasedCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'redis': {
+        'BACKEND': 'core.cache.redis.RedisCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', 'redis://127.0.0.1:6379/0'
+        ),
+        'OPTIONS': {'SOCKET_TIMEOUT': 1},
+    },
+}
+
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    'default': CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')],
 }
 
+# Потоки в процессе веб-сервера, создающие миниатюры новых изображений.
+# При 0 очередь обрабатывает только `manage.py generate_thumbnails`.
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+
+# Отложенная запись комментариев и подписок: запросы дописывают их
+# в файлы очереди WRITE_BEHIND_DIR, а раз в WRITE_BEHIND_INTERVAL секунд
+# они переносятся в базу пачкой. Переносит поток веб-процесса при
+# WRITE_BEHIND_THREAD, иначе `manage.py flush_writes --watch`.
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND') == 'True'
+WRITE_BEHIND_DIR = os.environ.get(
+    'WRITE_BEHIND_DIR', os.path.join(BASE_DIR, 'write_queue')
+)
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1))
+WRITE_BEHIND_THREAD = os.environ.get('WRITE_BEHIND_THREAD', 'True') == 'True'
+
+# Доля запросов, у которых замеряются база, кеш и шаблоны: им
+# добавляется заголовок Server-Timing. Время ответа замеряется у всех.
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.01))
+
+# Поиск повторяющихся (N+1) и медленных запросов к базе. Повтор —
+# N_PLUS_ONE_THRESHOLD одинаковых запросов за один запрос к сайту;
+# при N_PLUS_ONE_RAISE он вызывает ошибку, иначе пишется в лог.
+QUERY_LOG = os.environ.get('QUERY_LOG') == 'True'
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+N_PLUS_ONE_RAISE = os.environ.get('N_PLUS_ONE_RAISE') == 'True'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -52,6 +100,9 @@ INTERNAL_IPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.QueryLogMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,7 +120,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -86,15 +137,47 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# yatube.asgi.application выполняет запросы в пуле из ASGI_THREADS
+# потоков. QUERY_THREADS потоков выполняют независимые запросы к базе
+# внутри одного запроса к сайту, при 0 они выполняются по очереди.
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 16))
+QUERY_THREADS = int(os.environ.get('QUERY_THREADS', 4))
+
 
 # Database
+# SQLITE_TUNING=True включает WAL, постоянные соединения и повтор
+# запросов к занятой базе (core.db.sqlite3) для небольших установок.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING') == 'True'
+SQLITE_ENGINE = (
+    'core.db.sqlite3' if SQLITE_TUNING else 'django.db.backends.sqlite3'
+)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': SQLITE_ENGINE,
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600 if SQLITE_TUNING else 0,
     }
 }
 
+# Реплики для чтения: пути к копиям базы через запятую в DATABASE_REPLICAS.
+# Из них читают только списки постов и страницы поста и профиля; после
+# записи клиент REPLICA_PIN_SECONDS секунд читает с основной базы.
+REPLICA_DATABASES = []
+for number, name in enumerate(
+    filter(None, os.environ.get('DATABASE_REPLICAS', '').split(','))
+):
+    REPLICA_DATABASES.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {
+        'ENGINE': SQLITE_ENGINE,
+        'NAME': name,
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [